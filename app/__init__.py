@@ -1,23 +1,29 @@
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from app.extensions import db, login_manager
 import os
 from app.routes.auth import auth
 from app.routes.dashboard import dash
 from app.routes.listings import listings
 from app.routes.admin import admin
-from app.models import User
+from app.search import install_listing_fts, rebuild_search_index_command
+from app.migrations import run_migrations, upgrade_db_command
+from app.commands import check_active_loans_command
+from app.scale_seed import seed_scale_command
+from app.services.dashboard_service import DashboardService, site_metrics_cache
+from app.services.user_service import load_user_snapshot, user_snapshot_cache
+from app.passwords import DEFAULT_HASH_METHOD, hashing_pool
+from app.rate_limit import auth_rate_limiter
+from app.instrumentation import init_instrumentation, request_metrics
+from app.templating import configure_templates, precompile_templates_command
+from app.fragments import listing_card_cache, render_listing_card
+from app.etags import CHANGE_COUNTERS
+from app.models import SiteCounter
+from app.database import (configure_sqlite, sqlite_pragmas_from_env, database_url,
+                          engine_options_from_env, create_replica_engines, DEFAULT_DATABASE_URL)
 from dotenv import load_dotenv
-from sqlalchemy import event
-from sqlalchemy.engine import Engine
 import logging
 
-# Enable foreign key constraints in SQLite
-@event.listens_for(Engine, "connect")
-def set_sqlite_pragma(dbapi_connection, connection_record):
-    cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
-    cursor.close()
-
 # Load environment variables from a .env file
 load_dotenv()
 
@@ -26,7 +32,7 @@ logging.basicConfig(filename='app.log', level=logging.ERROR,
                     format='%(asctime)s %(levelname)s: %(message)s')
 
 
-def create_app(testing=False):
+def create_app(testing=False, config=None):
 
     # Create Flask app instance and specify static folder location
     app = Flask(__name__, static_folder='static')
@@ -35,29 +41,118 @@ def create_app(testing=False):
     app.secret_key = os.environ.get('SECRET_KEY', 'testing_secret_key')
 
     # Configure database based on whether testing or running normally
+    # (TEST_DATABASE_URL runs the tests against another database, e.g. a pooled server)
     if testing:
         app.config["TESTING"] = True
-        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        app.config["SQLALCHEMY_DATABASE_URI"] = database_url(os.environ.get('TEST_DATABASE_URL', "sqlite:///:memory:"))
     else:
-        app.config["SQLALCHEMY_DATABASE_URI"] = 'sqlite:///bookshare.db'
+        app.config["SQLALCHEMY_DATABASE_URI"] = database_url(os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL))
         app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    # Number of records shown per page on the listings, loans and users pages
+    app.config["PAGE_SIZE"] = int(os.environ.get('PAGE_SIZE', 20))
+
+    # Seconds the site-wide dashboard metrics are cached for (0 disables the cache)
+    app.config["METRICS_CACHE_TTL"] = float(os.environ.get('METRICS_CACHE_TTL', 30))
+
+    # Read replicas for read-only routes (comma-separated URLs), and the seconds a user's
+    # reads stay on the primary after they write so they see their own changes
+    app.config["SQLALCHEMY_REPLICA_URIS"] = [
+        database_url(url.strip()) for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()
+    ]
+    app.config["REPLICA_LAG_SECONDS"] = float(os.environ.get('REPLICA_LAG_SECONDS', 5))
+
+    # Seconds a logged-in user's details are cached between requests (0 disables the cache)
+    app.config["USER_CACHE_TTL"] = float(os.environ.get('USER_CACHE_TTL', 30))
+
+    # Werkzeug password hash method and cost, stored hashes are upgraded on login
+    app.config["PASSWORD_HASH_METHOD"] = os.environ.get('PASSWORD_HASH_METHOD', DEFAULT_HASH_METHOD)
+
+    # Password hashes run on a pool of this many threads, with at most HASHING_QUEUE_LIMIT
+    # more waiting before logins are turned away with a "try again" message
+    app.config["HASHING_WORKERS"] = int(os.environ.get('HASHING_WORKERS', os.cpu_count() or 2))
+    app.config["HASHING_QUEUE_LIMIT"] = int(os.environ.get('HASHING_QUEUE_LIMIT', 16))
+
+    # Login and registration attempts allowed per client IP and per username, as
+    # "attempts/seconds". RATE_LIMIT_STORAGE is an SQLite file path for limits shared by all workers
+    app.config["RATE_LIMIT_ENABLED"] = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('true', '1', 'yes')
+    app.config["AUTH_RATE_LIMIT_PER_IP"] = os.environ.get('AUTH_RATE_LIMIT_PER_IP', '20/60')
+    app.config["AUTH_RATE_LIMIT_PER_USERNAME"] = os.environ.get('AUTH_RATE_LIMIT_PER_USERNAME', '5/60')
+    app.config["RATE_LIMIT_STORAGE"] = os.environ.get('RATE_LIMIT_STORAGE') or None
+    # Number of reverse proxies in front of the app whose X-Forwarded-For is trusted for the client IP
+    # (0 uses the connecting address, which behind a proxy is the proxy's own)
+    app.config["PROXY_FIX_X_FOR"] = int(os.environ.get('PROXY_FIX_X_FOR', 0))
+
+    # Requests kept per endpoint for the admin performance page, and whether every response
+    # (not just debug mode ones) carries its query count and timings in a Server-Timing header
+    app.config["REQUEST_METRICS_WINDOW"] = int(os.environ.get('REQUEST_METRICS_WINDOW', 1000))
+    app.config["REQUEST_STATS_HEADER"] = os.environ.get('REQUEST_STATS_HEADER', 'false').lower() in ('true', '1', 'yes')
+
+    # Folder compiled templates are kept in between restarts (unset keeps them in memory only),
+    # and whether every template is compiled at startup instead of on its first request
+    app.config["TEMPLATE_CACHE_DIR"] = os.environ.get('TEMPLATE_CACHE_DIR') or None
+    app.config["TEMPLATE_PRECOMPILE"] = os.environ.get('TEMPLATE_PRECOMPILE', 'false').lower() in ('true', '1', 'yes')
+
+    # Seconds rendered listing cards are cached for (0 disables the cache), and at most how many are kept
+    app.config["FRAGMENT_CACHE_TTL"] = float(os.environ.get('FRAGMENT_CACHE_TTL', 300))
+    app.config["FRAGMENT_CACHE_SIZE"] = int(os.environ.get('FRAGMENT_CACHE_SIZE', 5000))
+
+    # Whether the listings, loans and users pages send an ETag and answer matching requests with a 304
+    app.config["CONDITIONAL_GET_ENABLED"] = os.environ.get('CONDITIONAL_GET_ENABLED', 'true').lower() in ('true', '1', 'yes')
+
+    # PRAGMAs applied to each SQLite connection (foreign keys, WAL, busy timeout, caches)
+    app.config["SQLITE_PRAGMAS"] = sqlite_pragmas_from_env()
+
+    # Explicit overrides, e.g. a file database for tests that need several connections
+    if config:
+        app.config.update(config)
+
+    # Connection pool settings (size, overflow, pre-ping, recycle) for the configured database
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options_from_env(app.config["SQLALCHEMY_DATABASE_URI"]))
+
+    site_metrics_cache.configure(app.config["METRICS_CACHE_TTL"])
+    user_snapshot_cache.configure(app.config["USER_CACHE_TTL"])
+    listing_card_cache.configure(app.config["FRAGMENT_CACHE_TTL"], app.config["FRAGMENT_CACHE_SIZE"])
+    hashing_pool.configure(app.config["HASHING_WORKERS"], app.config["HASHING_QUEUE_LIMIT"])
+    auth_rate_limiter.configure(
+        per_ip=app.config["AUTH_RATE_LIMIT_PER_IP"],
+        per_username=app.config["AUTH_RATE_LIMIT_PER_USERNAME"],
+        storage=app.config["RATE_LIMIT_STORAGE"],
+        enabled=app.config["RATE_LIMIT_ENABLED"],
+    )
+    # Take the client IP (used by the login rate limits) from the trusted proxies' X-Forwarded-For
+    if app.config["PROXY_FIX_X_FOR"]:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_FIX_X_FOR"])
+    request_metrics.configure(app.config["REQUEST_METRICS_WINDOW"])
+    init_instrumentation(app)
+
     # Initialise the database with the Flask app
     db.init_app(app)
 
     # Create all database tables within the app context
     with app.app_context():
+        configure_sqlite(db.engine, app.config["SQLITE_PRAGMAS"])
+        app.extensions["replica_engines"] = create_replica_engines(app)
         db.create_all()
+        # Upgrade databases created by older versions (e.g. add new indexes)
+        run_migrations(db.engine)
+        # Full-text search index for listings (SQLite FTS5 only)
+        app.config["LISTING_FTS_ENABLED"] = install_listing_fts(db.engine)
+        # Site-wide counters, imported once from the legacy metrics file
+        metrics_file = None if testing else os.path.join(app.static_folder, 'metrics.json')
+        DashboardService(db.session).import_metrics_file(metrics_file)
+        # Per-table change counters, the list pages' ETags are built from them
+        SiteCounter.ensure_exists(db.session, list(CHANGE_COUNTERS.values()))
 
     # Configure Flask-Login
     login_manager.login_view = 'auth.login'
     login_manager.login_message_category = "warning"
     login_manager.init_app(app)
 
-    # Load the current user from the database by ID
+    # Load the current user by ID, as a cached snapshot rather than the full record
     @login_manager.user_loader
     def load_user(user_id):
-        return db.session.get(User, int(user_id))
+        return load_user_snapshot(db.session, int(user_id))
 
     # Register route blueprints
     app.register_blueprint(auth)
@@ -65,4 +160,17 @@ def create_app(testing=False):
     app.register_blueprint(listings)
     app.register_blueprint(admin)
 
+    # Listing cards are rendered through the fragment cache
+    app.jinja_env.globals["render_listing_card"] = render_listing_card
+
+    # Compiled template cache, kept on disk and/or filled at startup
+    configure_templates(app)
+
+    # Register CLI commands
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(upgrade_db_command)
+    app.cli.add_command(check_active_loans_command)
+    app.cli.add_command(seed_scale_command)
+    app.cli.add_command(precompile_templates_command)
+
     return app
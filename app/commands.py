@@ -0,0 +1,25 @@
+from flask.cli import with_appcontext
+from app.extensions import db
+from app.models import Listing
+import click
+
+
+@click.command('check-active-loans')
+@click.option('--repair', is_flag=True, help="Fix any listings whose active loan pointer has drifted.")
+@with_appcontext
+def check_active_loans_command(repair):
+    """Check every listing's active_loan_id against its loan history"""
+    drift = Listing.active_loan_drift(db.session)
+    if not drift:
+        click.echo("All listings point at their active loan.")
+        return
+
+    for listing_id, loan_id in sorted(drift.items()):
+        click.echo(f"Listing {listing_id}: expected active loan {loan_id}")
+
+    if repair:
+        Listing.repair_active_loans(db.session)
+        db.session.commit()
+        click.echo(f"Repaired {len(drift)} listing(s).")
+    else:
+        click.echo(f"{len(drift)} listing(s) out of step, run with --repair to fix them.")
@@ -0,0 +1,140 @@
+from flask import current_app, g, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import Select
+import os
+import random
+import time
+
+# Used when DATABASE_URL is not set
+DEFAULT_DATABASE_URL = 'sqlite:///bookshare.db'
+
+# PRAGMAs run on every new SQLite connection. WAL lets readers and the writer work at the
+# same time, NORMAL sync is safe under WAL, and busy_timeout makes a blocked writer wait
+# (in milliseconds) instead of failing with "database is locked".
+# Each value can be overridden with an SQLITE_<NAME> environment variable.
+DEFAULT_SQLITE_PRAGMAS = {
+    "foreign_keys": "ON",
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -20000,       # negative values are KiB, so about 20 MB per connection
+    "mmap_size": 134217728,     # 128 MB of the file read through memory mapping
+    "temp_store": "MEMORY",
+}
+
+
+def database_url(url):
+    """Return the SQLAlchemy URL for a configured database URL.
+    Plain mysql:// URLs use the PyMySQL driver from requirements.txt"""
+    if url.startswith('mysql://'):
+        return 'mysql+pymysql://' + url[len('mysql://'):]
+    return url
+
+
+def is_sqlite_memory(url):
+    """Check if the URL is an in-memory SQLite database"""
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options_from_env(url):
+    """Return SQLALCHEMY_ENGINE_OPTIONS for the database, with pool settings from the environment.
+    In-memory SQLite keeps Flask-SQLAlchemy's single shared connection, so gets no pool settings"""
+    if is_sqlite_memory(url):
+        return {}
+    return {
+        "pool_size": int(os.environ.get('DB_POOL_SIZE', 10)),
+        "max_overflow": int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        # Check connections before use so ones dropped by the server are replaced
+        "pool_pre_ping": os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('true', '1', 'yes'),
+        # Seconds before a connection is replaced, below common server idle timeouts
+        "pool_recycle": int(os.environ.get('DB_POOL_RECYCLE', 280)),
+    }
+
+
+def sqlite_pragmas_from_env():
+    """Return the SQLite pragma profile with any SQLITE_<NAME> environment overrides applied"""
+    return {
+        name: os.environ.get(f"SQLITE_{name.upper()}", value)
+        for name, value in DEFAULT_SQLITE_PRAGMAS.items()
+    }
+
+
+def configure_sqlite(engine, pragmas):
+    """Apply the pragma profile to every connection the engine opens.
+    Does nothing for other databases. Returns True if the hook was installed"""
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return True
+
+
+# Flask session key holding the time until which the user's reads stay on the primary
+PRIMARY_UNTIL = 'db_primary_until'
+
+
+def create_replica_engines(app):
+    """Create an engine for each read replica in SQLALCHEMY_REPLICA_URIS.
+    SQLite replicas are opened query-only so nothing can be written to them by mistake"""
+    engines = []
+    for url in app.config.get("SQLALCHEMY_REPLICA_URIS", []):
+        engine = create_engine(url, **engine_options_from_env(url))
+        configure_sqlite(engine, dict(app.config["SQLITE_PRAGMAS"], query_only="ON"))
+        engines.append(engine)
+    return engines
+
+
+def current_replica():
+    """Return the replica engine reads should use, or None to read from the primary.
+    Replicas are only used on read-only routes, and not once the user has written recently"""
+    if not has_request_context() or not g.get('read_only_route') or g.get('stick_to_primary'):
+        return None
+    engines = current_app.extensions.get('replica_engines')
+    if not engines or flask_session.get(PRIMARY_UNTIL, 0) > time.time():
+        return None
+    #One replica per request so every read sees the same copy
+    if g.get('replica_engine') is None:
+        g.replica_engine = random.choice(engines)
+    return g.replica_engine
+
+
+def stick_to_primary():
+    """Send the rest of this request, and the user's reads for REPLICA_LAG_SECONDS, to the primary"""
+    if not has_request_context():
+        return
+    g.stick_to_primary = True
+    if current_app.extensions.get('replica_engines'):
+        flask_session[PRIMARY_UNTIL] = time.time() + current_app.config["REPLICA_LAG_SECONDS"]
+
+
+class RoutingSession(Session):
+    """Session that sends SELECTs made by read-only routes to a read replica.
+    Writes, locking reads and anything after a write in the same request use the primary"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and isinstance(clause, Select)
+                and clause._for_update_arg is None):
+            replica = current_replica()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _stick_after_flush(session, flush_context):
+    stick_to_primary()
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _stick_after_bulk_write(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        stick_to_primary()
@@ -0,0 +1,127 @@
+from datetime import date
+from functools import wraps
+from flask import current_app, request, session, make_response
+from flask_login import current_user
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models import SiteCounter
+import hashlib
+import os
+
+# Tables with a change counter in the site_counter table, bumped by every commit that writes to them
+CHANGE_COUNTERS = {table: f"{table}_changes" for table in ('user', 'genre', 'listing', 'loan')}
+
+# Rows the database removes or updates itself when a row of these tables is deleted
+# (ON DELETE CASCADE / SET NULL), which the session never sees
+_DELETE_AFFECTS = {
+    'user': ('listing', 'loan'),
+    'genre': ('listing',),
+    'listing': ('loan',),
+    'loan': ('listing',),
+}
+
+
+def _table_name(instance):
+    return getattr(type(instance), '__tablename__', None)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_table_changes(session, flush_context):
+    """Remember which tables a flush wrote to"""
+    changed = session.info.setdefault("changed_tables", set())
+    for instance in session.new:
+        changed.add(_table_name(instance))
+    for instance in session.dirty:
+        if session.is_modified(instance):
+            changed.add(_table_name(instance))
+    for instance in session.deleted:
+        table = _table_name(instance)
+        changed.add(table)
+        changed.update(_DELETE_AFFECTS.get(table, ()))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_table_statements(orm_execute_state):
+    """Remember bulk INSERT/UPDATE/DELETE statements (e.g. Listing.claim_for_loan)"""
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            orm_execute_state.session.info.setdefault("changed_tables", set()).add(mapper.local_table.name)
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_change_counters(session):
+    """Bump the counters of the changed tables in the transaction being committed"""
+    session.flush()
+    tables = session.info.pop("changed_tables", set())
+    bump_change_counters(session, tables)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_table_changes(session):
+    session.info.pop("changed_tables", None)
+
+
+def bump_change_counters(connection, tables):
+    """Add one to the change counter of each given table, with a single UPDATE.
+    Takes a session or a connection, for writes made outside the ORM"""
+    names = [CHANGE_COUNTERS[table] for table in tables if table in CHANGE_COUNTERS]
+    if names:
+        connection.execute(
+            update(SiteCounter.__table__)
+            .where(SiteCounter.__table__.c.name.in_(names))
+            .values(value=SiteCounter.__table__.c.value + 1)
+        )
+
+
+def _deployment_stamp(app):
+    """Changes whenever the code or templates are updated, so pages cached by a browser
+    before a deploy are not reused after it"""
+    stamp = app.extensions.get("etag_deployment_stamp")
+    if stamp is None:
+        files = []
+        for folder, _, names in os.walk(app.root_path):
+            for name in names:
+                if name.endswith(('.py', '.html')):
+                    info = os.stat(os.path.join(folder, name))
+                    files.append((folder, name, info.st_mtime_ns, info.st_size))
+        stamp = app.extensions["etag_deployment_stamp"] = hashlib.sha1(repr(sorted(files)).encode()).hexdigest()
+    return stamp
+
+
+def page_etag(tables):
+    """Version stamp of the current page: the change counters of the tables it shows,
+    the query string, the viewer and the date (loans become overdue without any write)"""
+    counters = SiteCounter.get_values(db.session, [CHANGE_COUNTERS[table] for table in tables])
+    parts = (
+        _deployment_stamp(current_app), request.endpoint, sorted(request.args.items(multi=True)),
+        current_user.user_id, current_user.is_admin, date.today().isoformat(), sorted(counters.items()),
+    )
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def conditional_get(*tables):
+    """Decorator for list pages that only change when the given tables do.
+    The response carries a weak ETag, and a request whose If-None-Match matches it gets a 304
+    before the view runs its queries or renders anything. Pages with a flash message waiting are
+    always rendered, as the message is only shown once"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not current_app.config.get("CONDITIONAL_GET_ENABLED", True) or session.get('_flashes'):
+                return f(*args, **kwargs)
+
+            etag = page_etag(tables)
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            #Browsers must check back every time, and shared caches must not keep a user's page
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
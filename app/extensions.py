@@ -1,8 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from app.database import RoutingSession
 
-# create a single database instance 
-db = SQLAlchemy()
+# create a single database instance, its session can send reads to replicas
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 #Create a loginManager instance to handle session management and authentication 
 login_manager = LoginManager()
@@ -0,0 +1,73 @@
+from flask import current_app
+from flask_login import current_user
+from markupsafe import Markup
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+from app.models import Listing, Loan
+from app.utils import TTLCache
+
+# Process-wide cache of rendered listing cards, the TTL and size are set from
+# FRAGMENT_CACHE_TTL and FRAGMENT_CACHE_SIZE in create_app
+listing_card_cache = TTLCache()
+
+_listing_table = Listing.__table__
+
+
+@event.listens_for(Session, "after_flush")
+def _track_listing_changes(session, flush_context):
+    """Remember which listings a flush changed, directly or through one of their loans"""
+    changed = session.info.setdefault("changed_listing_ids", set())
+    for instance in session.dirty:
+        if isinstance(instance, (Listing, Loan)) and session.is_modified(instance):
+            changed.add(instance.listing_id)
+    for instance in (*session.new, *session.deleted):
+        if isinstance(instance, Loan):
+            changed.add(instance.listing_id)
+    changed.discard(None)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _bump_listing_versions(session, flush_context):
+    """Bump the version of every changed listing in one UPDATE, in the same transaction as the change"""
+    listing_ids = session.info.pop("changed_listing_ids", None)
+    if not listing_ids:
+        return
+
+    session.execute(
+        update(_listing_table)
+        .where(_listing_table.c.listing_id.in_(listing_ids))
+        .values(version=_listing_table.c.version + 1)
+    )
+    #Listings loaded in this session read their new version on next access
+    for instance in session.identity_map.values():
+        if isinstance(instance, Listing) and instance.listing_id in listing_ids:
+            session.expire(instance, ['version'])
+
+
+def _card_key(listing, scope, today):
+    """Everything a card's HTML depends on. Related names are part of the key,
+    so renaming a genre or user never serves a stale card"""
+    owner = listing.user_id == current_user.user_id
+    genre = (listing.genre.name, listing.genre.image) if listing.genre else None
+    key = (listing.listing_id, listing.version, scope, current_user.is_admin, owner,
+           genre, listing.user.username)
+    if scope == 'self':
+        #The owner's view also shows the borrowers, and marks loans overdue against today
+        borrowers = tuple(loan.user.username for loan in listing.loans)
+        active_loan = listing.active_loan
+        key += (today, borrowers, active_loan.user.username if active_loan else None)
+    return key
+
+
+def render_listing_card(listing, scope, today, genre_colors):
+    """Render one listing card, from the cache when the listing has not changed since it was cached.
+    Rendered with the template directly rather than render_template, so each card
+    is not counted as a separate template render in the request stats"""
+    key = _card_key(listing, scope, today)
+    html = listing_card_cache.get(key)
+    if html is None:
+        template = current_app.jinja_env.get_template('listing_card.html')
+        html = template.render(listing=listing, scope=scope, today=today,
+                               genre_colors=genre_colors, current_user=current_user)
+        listing_card_cache.set(key, html)
+    return Markup(html)
@@ -0,0 +1,139 @@
+from collections import defaultdict, deque
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import threading
+import time
+
+# Percentiles shown on the admin performance page
+PERCENTILES = (50, 95, 99)
+
+
+class RequestStats:
+    """ Query count, database time and template time for the current request """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_started = None
+
+    def server_timing(self, latency):
+        """Format the stats as a Server-Timing header (durations in milliseconds) """
+        return (f'db;desc="{self.query_count} queries";dur={self.db_time * 1000:.2f}, '
+                f'template;dur={self.template_time * 1000:.2f}, '
+                f'total;dur={latency * 1000:.2f}')
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers """
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+class RequestMetrics:
+    """ Keeps the most recent `window` requests for each endpoint and summarises them """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def configure(self, window):
+        """Set how many requests are kept per endpoint and drop the recorded ones """
+        with self._lock:
+            self.window = window
+            self._samples.clear()
+            self._counts.clear()
+
+    def record(self, endpoint, latency, stats):
+        with self._lock:
+            self._samples[endpoint].append((latency, stats.db_time, stats.template_time, stats.query_count))
+            self._counts[endpoint] += 1
+
+    def summary(self):
+        """Per-endpoint request counts, latency percentiles and average query and render costs
+        (times in milliseconds), slowest p95 first """
+        with self._lock:
+            samples = {endpoint: list(window) for endpoint, window in self._samples.items()}
+            counts = dict(self._counts)
+
+        rows = []
+        for endpoint, window in samples.items():
+            latencies, db_times, template_times, query_counts = zip(*window)
+            row = {"endpoint": endpoint, "requests": counts[endpoint], "sampled": len(window)}
+            for pct in PERCENTILES:
+                row[f"p{pct}"] = round(percentile(latencies, pct) * 1000, 2)
+            row["avg_queries"] = round(sum(query_counts) / len(window), 1)
+            row["max_queries"] = max(query_counts)
+            row["avg_db_ms"] = round(sum(db_times) / len(window) * 1000, 2)
+            row["avg_template_ms"] = round(sum(template_times) / len(window) * 1000, 2)
+            rows.append(row)
+        return sorted(rows, key=lambda row: row["p95"], reverse=True)
+
+
+# Process-wide request metrics, the window is set from REQUEST_METRICS_WINDOW in create_app
+request_metrics = RequestMetrics()
+
+
+def current_stats():
+    """The stats of the request being handled, or None outside a request """
+    if not has_request_context():
+        return None
+    return g.get('request_stats')
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    if current_stats() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats()
+    started = conn.info.get('query_started')
+    if stats is not None and started:
+        stats.db_time += time.perf_counter() - started.pop()
+        stats.query_count += 1
+
+
+def _template_started(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None:
+        stats.template_started = time.perf_counter()
+
+
+def _template_finished(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None and stats.template_started is not None:
+        stats.template_time += time.perf_counter() - stats.template_started
+        stats.template_started = None
+
+
+def init_instrumentation(app):
+    """Record query count, database time, template time and latency for every request.
+    The stats are sent back in a Server-Timing header in debug mode or with REQUEST_STATS_HEADER set """
+
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+
+    @app.before_request
+    def start_request_stats():
+        g.request_stats = RequestStats()
+
+    @app.after_request
+    def finish_request_stats(response):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return response
+
+        latency = time.perf_counter() - stats.started
+        request_metrics.record(request.endpoint or 'unmatched', latency, stats)
+        if app.debug or app.config.get("REQUEST_STATS_HEADER"):
+            response.headers['Server-Timing'] = stats.server_timing(latency)
+            response.headers['X-Query-Count'] = str(stats.query_count)
+        return response
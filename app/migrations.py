@@ -0,0 +1,135 @@
+from datetime import date
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, select, update
+from sqlalchemy.schema import AddConstraint
+from app.extensions import db
+from app.models import User, Genre, Listing, Loan
+import click
+
+
+def add_missing_column(connection, column, default_sql):
+    """Add a column declared on a model to an existing table if it is missing.
+    Returns True if the column was added"""
+    table = column.table
+    existing = {info['name'] for info in inspect(connection).get_columns(table.name)}
+    if column.name in existing:
+        return False
+
+    preparer = connection.dialect.identifier_preparer
+    column_type = column.type.compile(dialect=connection.dialect)
+    nullable = "" if column.nullable else f" NOT NULL DEFAULT {default_sql}"
+    connection.exec_driver_sql(
+        f"ALTER TABLE {preparer.format_table(table)} "
+        f"ADD COLUMN {preparer.format_column(column)} {column_type}{nullable}"
+    )
+    return True
+
+
+def backfill_lowercase(connection, model, source, target):
+    """Fill a normalised column with the lower-cased value of its source column"""
+    primary_key = model.__mapper__.primary_key[0]
+    rows = connection.execute(select(primary_key, source)).all()
+    for record_id, value in rows:
+        connection.execute(
+            update(model.__table__).where(primary_key == record_id).values({target.name: value.lower()})
+        )
+
+
+def add_username_normalized(connection):
+    """Add and backfill user.username_normalized (its unique index is created afterwards)"""
+    if add_missing_column(connection, User.__table__.c.username_normalized, "''"):
+        backfill_lowercase(connection, User, User.username, User.__table__.c.username_normalized)
+
+
+def add_genre_name_normalized(connection):
+    """Add and backfill genre.name_normalized"""
+    if add_missing_column(connection, Genre.__table__.c.name_normalized, "''"):
+        backfill_lowercase(connection, Genre, Genre.name, Genre.__table__.c.name_normalized)
+
+
+def set_not_null_sql(dialect, column):
+    """The ALTER TABLE statement that makes an existing column NOT NULL,
+    or None where the database cannot do it in place (SQLite)"""
+    preparer = dialect.identifier_preparer
+    table, name = preparer.format_table(column.table), preparer.format_column(column)
+    if dialect.name == 'postgresql':
+        return f"ALTER TABLE {table} ALTER COLUMN {name} SET NOT NULL"
+    if dialect.name in ('mysql', 'mariadb'):
+        return f"ALTER TABLE {table} MODIFY {name} {column.type.compile(dialect=dialect)} NOT NULL"
+    return None
+
+
+def backfill_sort_dates(connection):
+    """Give rows from older versions a date in each keyset-paginated sort column, then make
+    the columns NOT NULL so no later row can drop out of the pages.
+    Undated rows are given the date the upgrade ran. SQLite cannot add NOT NULL to an existing
+    column, there the model defaults keep new rows dated"""
+    today = date.today()
+    for column in (User.__table__.c.join_date, Listing.__table__.c.date_listed, Loan.__table__.c.start_date):
+        connection.execute(update(column.table).where(column.is_(None)).values({column.name: today}))
+        statement = set_not_null_sql(connection.dialect, column)
+        if statement is None:
+            continue
+        columns = {info['name']: info for info in inspect(connection).get_columns(column.table.name)}
+        if columns[column.name]['nullable']:
+            connection.exec_driver_sql(statement)
+
+
+def add_listing_version(connection):
+    """Add listing.version, existing listings start at version 1"""
+    add_missing_column(connection, Listing.__table__.c.version, "1")
+
+
+def add_listing_active_loan(connection):
+    """Add listing.active_loan_id and point it at each listing's unreturned loan"""
+    column = Listing.__table__.c.active_loan_id
+    existing = {info['name'] for info in inspect(connection).get_columns('listing')}
+    if column.name in existing:
+        return
+
+    preparer = connection.dialect.identifier_preparer
+    if connection.dialect.name == 'sqlite':
+        #SQLite cannot add constraints later, but accepts the reference on a nullable new column
+        connection.exec_driver_sql(
+            f"ALTER TABLE listing ADD COLUMN {preparer.format_column(column)} INTEGER "
+            f"REFERENCES loan (loan_id) ON DELETE SET NULL"
+        )
+    else:
+        add_missing_column(connection, column, None)
+        connection.execute(AddConstraint(next(iter(column.foreign_keys)).constraint))
+    Listing.repair_active_loans(connection)
+
+
+def create_missing_indexes(connection):
+    """Create any index declared on the models that an existing database is missing.
+    db.create_all only creates indexes together with new tables"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+
+
+# Schema upgrades for databases created by an older version, applied in order
+MIGRATIONS = [
+    add_username_normalized,
+    add_genre_name_normalized,
+    add_listing_version,
+    add_listing_active_loan,
+    backfill_sort_dates,
+    create_missing_indexes,
+]
+
+
+def run_migrations(engine):
+    """Bring an existing database up to the current schema.
+    Every step is idempotent, so this is safe to run on every start"""
+    with engine.begin() as connection:
+        for migration in MIGRATIONS:
+            migration(connection)
+
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db_command():
+    """Apply schema upgrades to an existing database"""
+    run_migrations(db.engine)
+    click.echo("Database schema is up to date.")
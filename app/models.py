@@ -1,16 +1,32 @@
 from app.extensions import db
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 import logging
 from datetime import datetime, date
-from sqlalchemy import and_, func
+from app.utils import Page, encode_cursor, decode_cursor
+from app.search import matching_listing_ids, ranked_listing_matches
+from app.passwords import hash_password, verify_password_hash, needs_rehash
+from sqlalchemy import and_, or_, func, update, select
+from sqlalchemy.orm import joinedload, selectinload, contains_eager, validates, query_expression, with_expression
+
+
+# Session.info key set while a service transaction is open (see BaseService.transaction)
+UNIT_OF_WORK = 'unit_of_work'
+
+
+def in_unit_of_work(db_session):
+    """Check if saves on this session are being collected into one transaction"""
+    return db_session.info.get(UNIT_OF_WORK) is True
 
 
 class baseModel(db.Model):
     __abstract__ = True
 
     def save(self, db_session):
-        """Save the current record to the database"""
+        """Save the current record to the database.
+        Inside a service transaction the record is only staged, the transaction commits it"""
+        if in_unit_of_work(db_session):
+            db_session.add(self)
+            return True
         try:
             db_session.add(self)
             db_session.commit()
@@ -21,7 +37,11 @@ class baseModel(db.Model):
             return False
 
     def delete(self, db_session):
-        """Delete the current record from the database"""
+        """Delete the current record from the database.
+        Inside a service transaction the delete is only staged, the transaction commits it"""
+        if in_unit_of_work(db_session):
+            db_session.delete(self)
+            return True
         try:
             db_session.delete(self)
             db_session.commit()
@@ -42,6 +62,69 @@ class baseModel(db.Model):
                 f"Failed to get record {cls.__name__} with id={record_id}: {e}")
             return None
 
+    @classmethod
+    def paginate_keyset(cls, query, sort_column, sort_order='desc', cursor=None, page_size=20):
+        """Return one Page of a query ordered by (sort_column, primary key), sort_column being
+        a date or a number read back from an attribute of the same name. The cursor records the sort key of the row at the page edge, so every page
+        is an index range read instead of an OFFSET scan over the earlier pages"""
+        primary_key = cls.__mapper__.primary_key[0]
+        descending = sort_order != 'asc'
+
+        position = decode_cursor(cursor) if cursor else None
+        backwards = bool(position) and position.get('dir') == 'prev'
+
+        if position:
+            try:
+                key = (date.fromisoformat(position['key']) if isinstance(sort_column.type, db.Date)
+                       else float(position['key']))
+                record_id = int(position['id'])
+            except (KeyError, TypeError, ValueError):
+                position, backwards = None, False
+
+        #Walking backwards flips the comparison and the sort, then the rows are reversed
+        read_descending = descending != backwards
+        if position:
+            if read_descending:
+                query = query.filter(or_(
+                    sort_column < key,
+                    and_(sort_column == key, primary_key < record_id)
+                ))
+            else:
+                query = query.filter(or_(
+                    sort_column > key,
+                    and_(sort_column == key, primary_key > record_id)
+                ))
+
+        if read_descending:
+            query = query.order_by(sort_column.desc(), primary_key.desc())
+        else:
+            query = query.order_by(sort_column.asc(), primary_key.asc())
+
+        rows = query.limit(page_size + 1).all()
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return Page([])
+
+        def cursor_for(record, direction):
+            key = getattr(record, sort_column.key)
+            return encode_cursor({
+                'key': key.isoformat() if isinstance(key, date) else key,
+                'id': getattr(record, primary_key.key),
+                'dir': direction,
+            })
+
+        has_next = backwards or has_more
+        has_prev = has_more if backwards else position is not None
+        return Page(
+            rows,
+            next_cursor=cursor_for(rows[-1], 'next') if has_next else None,
+            prev_cursor=cursor_for(rows[0], 'prev') if has_prev else None,
+        )
+
     @classmethod
     def get_all(cls, db_session):
         """Get all record for a model"""
@@ -56,29 +139,52 @@ class baseModel(db.Model):
 class User(baseModel, UserMixin):
     user_id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(30), unique=True, nullable=False)
+    # Lower-cased copy of the username so case-insensitive lookups can seek an index
+    username_normalized = db.Column(db.String(30), nullable=False, index=True, unique=True)
     password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(50), nullable=False)
     marked_for_deletion = db.Column(db.Boolean, default=False)
     total_loans = db.Column(db.Integer)
     total_listings = db.Column(db.Integer)
-    join_date = db.Column(db.Date, default=date.today())
+    # Sort key of the keyset-paginated users page, so never NULL (see backfill_sort_dates)
+    join_date = db.Column(db.Date, default=date.today, nullable=False)
     listings = db.relationship(
         'Listing', back_populates='user', cascade='all, delete-orphan', passive_deletes=True)
     loans = db.relationship('Loan', back_populates='user',
                             cascade='all, delete-orphan', passive_deletes=True)
 
+    __table_args__ = (
+        # Admin user list: role filter and keyset pages ordered by join date
+        db.Index('ix_user_join_date', join_date, user_id),
+        db.Index('ix_user_role_join_date', role, join_date, user_id),
+        # Deletion requests are rare, so only those rows are indexed
+        db.Index('ix_user_marked_for_deletion', join_date, user_id,
+                 sqlite_where=marked_for_deletion.is_(True),
+                 postgresql_where=marked_for_deletion.is_(True)),
+    )
+
+    @validates('username')
+    def _normalize_username(self, key, username):
+        """Keep username_normalized in step whenever the username is set"""
+        self.username_normalized = username.lower() if username is not None else None
+        return username
+
     @property
     def is_admin(self):
         """Check the user has admin role """
         return self.role == 'admin'
 
     def set_password(self, password):
-        """Hash and store user passwords"""
-        self.password_hash = generate_password_hash(password)
+        """Hash and store user passwords with the configured hash policy"""
+        self.password_hash = hash_password(password)
 
     def verify_password(self, password):
         """Check a password against the stored hash """
-        return check_password_hash(self.password_hash, password)
+        return verify_password_hash(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        """Check if the stored hash is out of date with the configured hash policy"""
+        return needs_rehash(self.password_hash)
 
     def get_id(self):
         """Return user ID for Flask-Login"""
@@ -87,7 +193,7 @@ class User(baseModel, UserMixin):
     @classmethod
     def existing_user(cls, db_session, username):
         """Check if a user with this username exists"""
-        return db_session.query(cls).filter(func.lower(cls.username) == username.lower()).first()
+        return db_session.query(cls).filter(cls.username_normalized == username.lower()).first()
 
     @classmethod
     def count_admins(cls, db_session):
@@ -95,8 +201,9 @@ class User(baseModel, UserMixin):
         return db_session.query(cls).filter_by(role='admin').count()
 
     @classmethod
-    def filter_search_query(cls, db_session, search=None, filter_role=None, marked_for_deletion=None, sort_join_date='desc'):
-        """Apply filters to the user management page"""
+    def filter_search_query(cls, db_session, search=None, filter_role=None, marked_for_deletion=None, sort_join_date='desc', cursor=None, page_size=None):
+        """Apply filters to the user management page.
+        Returns a Page of users when page_size is given, otherwise every match"""
         query = db_session.query(cls)
 
         if search:
@@ -108,6 +215,9 @@ class User(baseModel, UserMixin):
         if marked_for_deletion == 'true':
             query = query.filter(cls.marked_for_deletion.is_(True))
 
+        if page_size is not None:
+            return cls.paginate_keyset(query, cls.join_date, sort_join_date, cursor, page_size)
+
         if sort_join_date == 'asc':
             query = query.order_by(cls.join_date.asc())
         else:
@@ -124,6 +234,32 @@ class User(baseModel, UserMixin):
         return self.save(db_session)
 
 
+class UserSnapshot(UserMixin):
+    """Detached copy of the user fields needed on every request (current_user).
+    Cached by the user loader in place of the full User record"""
+
+    def __init__(self, user_id, username, role, marked_for_deletion, join_date):
+        self.user_id = user_id
+        self.username = username
+        self.role = role
+        self.marked_for_deletion = marked_for_deletion
+        self.join_date = join_date
+
+    @classmethod
+    def from_user(cls, user):
+        """Take a snapshot of a User record"""
+        return cls(user.user_id, user.username, user.role, user.marked_for_deletion, user.join_date)
+
+    @property
+    def is_admin(self):
+        """Check the user has admin role """
+        return self.role == 'admin'
+
+    def get_id(self):
+        """Return user ID for Flask-Login"""
+        return str(self.user_id)
+
+
 class Listing(baseModel):
     listing_id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(150), nullable=False)
@@ -135,33 +271,138 @@ class Listing(baseModel):
     marked_for_deletion = db.Column(db.Boolean, default=False)
     user_id = db.Column(db.Integer, db.ForeignKey(
         'user.user_id', ondelete='CASCADE'), nullable=False)
-    date_listed = db.Column(db.Date)
+    date_listed = db.Column(db.Date, default=date.today, nullable=False)
+    # Denormalised pointer to the loan currently out on this listing (None when available)
+    active_loan_id = db.Column(db.Integer, db.ForeignKey(
+        'loan.loan_id', ondelete='SET NULL', use_alter=True, name='fk_listing_active_loan'), nullable=True)
+    # Bumped whenever the listing or one of its loans changes, cached listing cards are keyed on it
+    version = db.Column(db.Integer, nullable=False, default=1)
+    # bm25 rank against the search text, only loaded by searches sorted by relevance (lower is better)
+    search_rank = query_expression()
     user = db.relationship('User', back_populates='listings')
     genre = db.relationship('Genre', backref='listings')
-    loans = db.relationship('Loan', back_populates='listing',
+    loans = db.relationship('Loan', back_populates='listing', foreign_keys='Loan.listing_id',
                             cascade='all, delete-orphan', passive_deletes=True)
+    current_loan = db.relationship('Loan', foreign_keys=[active_loan_id], post_update=True)
+
+    __table_args__ = (
+        # Listing pages are keyset-paginated on (date_listed, listing_id) after any filter
+        db.Index('ix_listing_date_listed', date_listed, listing_id),
+        db.Index('ix_listing_user_date_listed', user_id, date_listed, listing_id),
+        db.Index('ix_listing_genre_date_listed', genre_id, date_listed, listing_id),
+        db.Index('ix_listing_available_date_listed', is_available, date_listed, listing_id),
+        # Deletion requests are rare, so only those rows are indexed
+        db.Index('ix_listing_marked_for_deletion', date_listed, listing_id,
+                 sqlite_where=marked_for_deletion.is_(True),
+                 postgresql_where=marked_for_deletion.is_(True)),
+    )
 
     @property
     def active_loan(self):
         """Return the current active loan for this listing (if it exists)"""
-        return next((loan for loan in self.loans if not loan.is_returned), None)
+        return self.current_loan
+
+    @classmethod
+    def claim_for_loan(cls, db_session, listing_id):
+        """Mark an available listing as unavailable with one conditional UPDATE.
+        Returns False if the listing was not available (e.g. another reservation won). Does not commit"""
+        result = db_session.execute(
+            update(cls)
+            .where(cls.listing_id == listing_id, cls.is_available.is_(True))
+            .values(is_available=False, version=cls.version + 1)
+        )
+        return result.rowcount == 1
+
+    @classmethod
+    def _expected_active_loan(cls):
+        """Correlated subquery for the ID of the listing's unreturned loan"""
+        return (select(func.max(Loan.loan_id))
+                .where(Loan.listing_id == cls.listing_id, Loan.is_returned.is_(False))
+                .scalar_subquery())
+
+    @classmethod
+    def active_loan_drift(cls, db_session):
+        """Find listings whose active_loan_id does not match their loan history.
+        Returns a dict of listing_id -> the loan ID it should point at (or None)"""
+        expected = cls._expected_active_loan()
+        rows = db_session.execute(
+            select(cls.listing_id, expected).where(cls.active_loan_id.is_distinct_from(expected))
+        )
+        return dict(rows.all())
 
     @classmethod
-    def filter_search_listings(cls, db_session, user_id=None, search=None, filter_genre=None, filter_availability=None, sort_order='desc', marked_for_deletion=None):
-        """Apply filters and search to listing queries"""
+    def repair_active_loans(cls, db_session):
+        """Point every listing's active_loan_id at its unreturned loan. Does not commit"""
+        expected = cls._expected_active_loan()
+        db_session.execute(
+            update(cls).where(cls.active_loan_id.is_distinct_from(expected))
+            .values(active_loan_id=expected, version=cls.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+    @classmethod
+    def search_condition(cls, search):
+        """Filter condition matching listings by title, author or description.
+        Uses the full-text index when available and falls back to LIKE otherwise"""
+        matching_ids = matching_listing_ids(search)
+        if matching_ids is not None:
+            return cls.listing_id.in_(matching_ids)
+        return (
+            (cls.title.ilike(f'%{search}%')) |
+            (cls.author.ilike(f'%{search}%')) |
+            (cls.description.ilike(f'%{search}%'))
+        )
+
+    @classmethod
+    def render_options(cls, render_profile=None):
+        """Return the eager-loading options a render profile needs.
+        'card' loads everything view_books.html touches for each listing card,
+        'card_history' adds the loan history shown on the owner's own cards,
+        so the page runs a fixed number of queries however many cards are shown"""
+        if render_profile in ('card', 'card_history'):
+            options = [
+                joinedload(cls.genre),
+                joinedload(cls.user),
+                joinedload(cls.current_loan).joinedload(Loan.user),
+            ]
+            if render_profile == 'card_history':
+                options.append(selectinload(cls.loans).joinedload(Loan.user))
+            return options
+        if render_profile is not None:
+            raise ValueError(f"Unknown render profile: {render_profile}")
+        return []
+
+    @classmethod
+    def filter_search_listings(cls, db_session, user_id=None, search=None, filter_genre=None, filter_availability=None, sort_order='desc', marked_for_deletion=None, render_profile=None, cursor=None, page_size=None):
+        """Apply filters and search to listing queries, sorted by date listed ('desc'/'asc')
+        or best search match first ('relevance').
+        Returns a Page of listings when page_size is given, otherwise every match"""
         
         query = db_session.query(cls)
 
+        options = cls.render_options(render_profile)
+        if options:
+            query = query.options(*options)
+
         if user_id:
             query = query.filter(cls.user_id == user_id)
-        if search:
-            query = query.filter(
-                (cls.title.ilike(f'%{search}%')) |
-                (cls.author.ilike(f'%{search}%'))
-            )
+
+        #Relevance sorts the full-text matches best first, without an index it falls back to newest first
+        ranked = ranked_listing_matches(search) if search and sort_order == 'relevance' else None
+        if ranked is not None:
+            query = (query.join(ranked, ranked.c.listing_id == cls.listing_id)
+                     .options(with_expression(cls.search_rank, ranked.c.search_rank)))
+            sort_column, sort_order = ranked.c.search_rank, 'asc'
+        else:
+            if search:
+                query = query.filter(cls.search_condition(search))
+            sort_column = cls.date_listed
+            if sort_order == 'relevance':
+                sort_order = 'desc'
 
         if filter_genre:
-            query = query.filter(Listing.genre.has(name=filter_genre))
+            genre_id = select(Genre.genre_id).where(Genre.name == filter_genre).scalar_subquery()
+            query = query.filter(cls.genre_id == genre_id)
 
         if filter_availability is not None:
             query = query.filter(Listing.is_available == filter_availability)
@@ -169,10 +410,13 @@ class Listing(baseModel):
         if marked_for_deletion is True:
             query = query.filter(cls.marked_for_deletion.is_(True))
 
+        if page_size is not None:
+            return cls.paginate_keyset(query, sort_column, sort_order, cursor, page_size)
+
         if sort_order == 'asc':
-            query = query.order_by(cls.date_listed.asc())
+            query = query.order_by(sort_column.asc(), cls.listing_id.asc())
         else:
-            query = query.order_by(cls.date_listed.desc())
+            query = query.order_by(sort_column.desc(), cls.listing_id.desc())
 
         return query.all()
 
@@ -198,26 +442,51 @@ class Loan(baseModel):
         'listing.listing_id', ondelete='CASCADE'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey(
         'user.user_id', ondelete='CASCADE'), nullable=False)
-    start_date = db.Column(db.Date)
+    start_date = db.Column(db.Date, default=date.today, nullable=False)
     return_date = db.Column(db.Date)
     actual_return_date = db.Column(db.Date, nullable=True)
     is_returned = db.Column(db.Boolean, default=False)
     user = db.relationship('User', back_populates='loans')
-    listing = db.relationship('Listing', back_populates='loans')
+    listing = db.relationship('Listing', back_populates='loans', foreign_keys=[listing_id])
+
+    __table_args__ = (
+        # Loan pages are keyset-paginated on (start_date, loan_id) after any filter
+        db.Index('ix_loan_start_date', start_date, loan_id),
+        db.Index('ix_loan_user_start_date', user_id, start_date, loan_id),
+        # Loan history per listing (and cascading deletes)
+        db.Index('ix_loan_listing_start_date', listing_id, start_date),
+        # Active loans are a small slice of the history: counts per user and site-wide
+        db.Index('ix_loan_active_user', user_id,
+                 sqlite_where=is_returned.is_(False),
+                 postgresql_where=is_returned.is_(False)),
+        # Active and overdue filters compare the due date of loans not yet returned
+        db.Index('ix_loan_outstanding_return_date', return_date,
+                 sqlite_where=actual_return_date.is_(None),
+                 postgresql_where=actual_return_date.is_(None)),
+    )
 
     @classmethod
-    def filter_search_loans(cls, db_session, user_id=None, filter_status=None, search=None, sort_order='desc'):
-        """Apply filters and search to loan queries"""
-        query = db_session.query(cls).join(cls.listing).join(cls.user)
+    def filter_search_loans(cls, db_session, user_id=None, filter_status=None, search=None, sort_order='desc', cursor=None, page_size=None):
+        """Apply filters and search to loan queries.
+        Returns a Page of loans when page_size is given, otherwise every match"""
+        #The joined listing and borrower fill the relationships the loans page shows, with the
+        #listing's genre and owner loaded alongside, so rendering a page runs no further queries
+        query = (
+            db_session.query(cls).join(cls.listing).join(cls.user)
+            .options(
+                contains_eager(cls.user),
+                contains_eager(cls.listing).joinedload(Listing.genre),
+                contains_eager(cls.listing).joinedload(Listing.user),
+            )
+        )
 
         if user_id is not None:
             query = query.filter(cls.user_id == user_id)
 
         if search:
             query = query.filter(
-                (Listing.title.ilike(f'%{search}%')) |
-                (User.username.ilike(f'%{search}%')) |
-                (Listing.author.ilike(f'%{search}%'))
+                Listing.search_condition(search) |
+                (User.username.ilike(f'%{search}%'))
             )
 
         if filter_status:
@@ -236,6 +505,9 @@ class Loan(baseModel):
                     cls.return_date < now
                 ))
 
+        if page_size is not None:
+            return cls.paginate_keyset(query, cls.start_date, sort_order, cursor, page_size)
+
         if sort_order == 'asc':
             query = query.order_by(cls.start_date.asc())
         else:
@@ -257,12 +529,20 @@ class Loan(baseModel):
 class Genre(baseModel):
     genre_id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(20), unique=True, nullable=False)
+    # Lower-cased copy of the name so case-insensitive lookups can seek an index
+    name_normalized = db.Column(db.String(20), nullable=False, index=True)
     image = db.Column(db.String(50), nullable=True)
 
+    @validates('name')
+    def _normalize_name(self, key, name):
+        """Keep name_normalized in step whenever the name is set"""
+        self.name_normalized = name.lower() if name is not None else None
+        return name
+
     @classmethod
     def exists_by_name(cls, db_session, name):
         """Check if a genre with a given name already exists"""
-        return db_session.query(cls).filter(func.lower(cls.name) == name.lower()).first()
+        return db_session.query(cls).filter(cls.name_normalized == name.lower()).first()
     
     @staticmethod
     def exists_by_name_excluding_id(db_session, name, exclude_id):
@@ -272,3 +552,35 @@ class Genre(baseModel):
             Genre.genre_id != exclude_id
         ).first() is not None
 
+
+class SiteCounter(baseModel):
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def increment(cls, db_session, name, amount=1):
+        """Add to a counter with a single UPDATE ... SET value = value + amount.
+        Does not commit, so the increment lands in the caller's transaction"""
+        result = db_session.execute(
+            update(cls).where(cls.name == name).values(value=cls.value + amount)
+        )
+        if result.rowcount == 0:
+            db_session.add(cls(name=name, value=amount))
+
+    @classmethod
+    def get_values(cls, db_session, names):
+        """Return a dict of counter values for the given names (missing counters are 0)"""
+        values = dict.fromkeys(names, 0)
+        for counter in db_session.query(cls).filter(cls.name.in_(names)):
+            values[counter.name] = counter.value
+        return values
+
+    @classmethod
+    def ensure_exists(cls, db_session, names, initial_values=None):
+        """Create any missing counters, starting from initial_values where given"""
+        initial_values = initial_values or {}
+        existing = {name for (name,) in db_session.query(cls.name).filter(cls.name.in_(names))}
+        for name in names:
+            if name not in existing:
+                db_session.add(cls(name=name, value=int(initial_values.get(name, 0))))
+        db_session.commit()
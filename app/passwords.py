@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, has_app_context
+from functools import lru_cache
+from werkzeug.security import generate_password_hash, check_password_hash
+import threading
+
+# Werkzeug hash method and cost used when PASSWORD_HASH_METHOD is not configured,
+# e.g. "scrypt:32768:8:1" (N, r, p) or "pbkdf2:sha256:600000" (iterations)
+DEFAULT_HASH_METHOD = 'scrypt:32768:8:1'
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool already has as many hashes waiting as it allows"""
+
+    def __init__(self, message="The server is busy, please try again in a moment."):
+        super().__init__(message)
+
+
+class HashingPool:
+    """Bounded thread pool that runs password hashing off the request thread.
+    At most `workers` hashes run at once and `max_queue` more may wait for a worker;
+    beyond that new work is rejected straight away with HashingBusy instead of piling up.
+    hashlib releases the GIL while it hashes, so the workers run in parallel"""
+
+    def __init__(self, workers=2, max_queue=16):
+        self._lock = threading.Lock()
+        self._executor = None
+        self.configure(workers, max_queue)
+
+    def configure(self, workers, max_queue):
+        """Resize the pool and reset its statistics"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self.workers = max(1, workers)
+            self.max_queue = max(0, max_queue)
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+            self._pending = 0
+            self.completed = 0
+            self.rejected = 0
+            self.peak_pending = 0
+
+    def run(self, func, *args, **kwargs):
+        """Run func on the pool and wait for its result.
+        Raises HashingBusy if the pool and its queue are full"""
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise HashingBusy()
+            self._pending += 1
+            self.peak_pending = max(self.peak_pending, self._pending)
+            executor = self._executor
+        try:
+            return executor.submit(func, *args, **kwargs).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self.completed += 1
+
+    def stats(self):
+        """Return the pool size, current load and counters"""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "running": min(self._pending, self.workers),
+                "queued": max(0, self._pending - self.workers),
+                "peak_pending": self.peak_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+
+# Shared by every request in the process, sized from HASHING_WORKERS and HASHING_QUEUE_LIMIT in create_app
+hashing_pool = HashingPool()
+
+
+def hash_method():
+    """Return the configured password hash policy"""
+    if has_app_context():
+        return current_app.config.get('PASSWORD_HASH_METHOD', DEFAULT_HASH_METHOD)
+    return DEFAULT_HASH_METHOD
+
+
+@lru_cache(maxsize=8)
+def _stored_prefix(method):
+    """The method part Werkzeug writes at the start of a hash, with any default parameters filled in"""
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+def hash_password(password):
+    """Hash a password with the current policy on the hashing pool.
+    Raises HashingBusy if the pool is full"""
+    return hashing_pool.run(generate_password_hash, password, method=hash_method())
+
+
+def verify_password_hash(password_hash, password):
+    """Check a password against a stored hash on the hashing pool.
+    Raises HashingBusy if the pool is full"""
+    return hashing_pool.run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """Check if a stored hash was made with a different method or cost than the current policy"""
+    return password_hash.split('$', 1)[0] != _stored_prefix(hash_method())
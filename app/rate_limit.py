@@ -0,0 +1,138 @@
+import math
+import sqlite3
+import threading
+import time
+
+# Buckets that have refilled completely are dropped at most this often (seconds)
+EVICT_INTERVAL = 60
+
+
+def parse_limit(limit):
+    """Parse a "capacity/seconds" limit such as "5/60" into (capacity, seconds).
+    The bucket holds `capacity` tokens and refills completely over `seconds`"""
+    capacity, seconds = limit.split('/')
+    return int(capacity), float(seconds)
+
+
+class MemoryBucketStore:
+    """Token buckets for one process, kept as (tokens, updated_at) tuples.
+    Buckets idle for max_idle seconds have refilled completely, so they are evicted"""
+
+    def __init__(self, max_idle):
+        self.max_idle = max_idle
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._next_eviction = 0
+
+    def take(self, key, capacity, seconds, now):
+        """Take a token from the bucket for key. Returns 0 if one was taken,
+        otherwise the seconds until the empty bucket has a token again"""
+        rate = capacity / seconds
+        with self._lock:
+            if now >= self._next_eviction:
+                self._evict(now)
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            return 0 if allowed else (1 - tokens) / rate
+
+    def _evict(self, now):
+        """Drop buckets that have refilled completely, a new bucket starts full anyway"""
+        cutoff = now - self.max_idle
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[1] > cutoff}
+        self._next_eviction = now + EVICT_INTERVAL
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBucketStore:
+    """Token buckets in an SQLite file, so every worker process shares the same limits"""
+
+    def __init__(self, path, max_idle):
+        self.path = path
+        self.max_idle = max_idle
+        self._local = threading.local()
+        self._next_eviction = 0
+        with self._connect() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS rate_limit_bucket (
+                key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)""")
+
+    def _connect(self):
+        """One connection per thread, in autocommit mode so transactions are explicit"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def take(self, key, capacity, seconds, now):
+        """Take a token from the bucket for key. Returns 0 if one was taken,
+        otherwise the seconds until the empty bucket has a token again"""
+        rate = capacity / seconds
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if now >= self._next_eviction:
+                connection.execute("DELETE FROM rate_limit_bucket WHERE updated_at <= ?",
+                                   (now - self.max_idle,))
+                self._next_eviction = now + EVICT_INTERVAL
+            row = connection.execute(
+                "SELECT tokens, updated_at FROM rate_limit_bucket WHERE key = ?", (key,)).fetchone()
+            tokens, updated_at = row if row else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            connection.execute(
+                "INSERT OR REPLACE INTO rate_limit_bucket (key, tokens, updated_at) VALUES (?, ?, ?)",
+                (key, tokens - 1 if allowed else tokens, now))
+            connection.execute("COMMIT")
+            return 0 if allowed else (1 - tokens) / rate
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM rate_limit_bucket").fetchone()[0]
+
+
+class AuthRateLimiter:
+    """Limits login and registration attempts per client IP and per username"""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.configure()
+
+    def configure(self, per_ip="20/60", per_username="5/60", storage=None, enabled=True):
+        """Set the limits and where the buckets are kept (None for this process only,
+        or the path of an SQLite file shared by every worker). Existing buckets are dropped"""
+        self.per_ip = parse_limit(per_ip)
+        self.per_username = parse_limit(per_username)
+        self.enabled = enabled
+        max_idle = max(self.per_ip[1], self.per_username[1])
+        self.store = SQLiteBucketStore(storage, max_idle) if storage else MemoryBucketStore(max_idle)
+        self.rejected = 0
+
+    def allow(self, ip, username=None):
+        """Take a token for the IP and, if one is given, the username.
+        Returns False if either of them is over its limit"""
+        return self.check(ip, username) == 0
+
+    def check(self, ip, username=None):
+        """Like allow, but returns 0 when allowed and otherwise the whole seconds to wait
+        for the bucket that refused. The username is not charged for an IP over its limit"""
+        if not self.enabled:
+            return 0
+        now = self.clock()
+        wait = self.store.take(f"ip:{ip}", *self.per_ip, now)
+        if not wait and username:
+            wait = self.store.take(f"user:{username.lower()}", *self.per_username, now)
+        if not wait:
+            return 0
+        self.rejected += 1
+        return max(1, math.ceil(wait))
+
+
+# Shared by the auth routes, configured from the AUTH_RATE_LIMIT_* settings in create_app
+auth_rate_limiter = AuthRateLimiter()
@@ -1,14 +1,20 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
 from flask_login import login_required, current_user
-from app.utils import admin_required
+from app.utils import admin_required, read_only
 from app.models import Genre, Listing, User, Loan
 from app.services.admin_service import AdminService
 from app.services.listing_service import ListingService
 from app.services.dashboard_service import DashboardService
 from app.extensions import db
+from app.passwords import hashing_pool
+from app.instrumentation import request_metrics
+from app.services.dashboard_service import site_metrics_cache
+from app.services.user_service import user_snapshot_cache
+from app.fragments import listing_card_cache
+from app.etags import conditional_get
 from app.utils import flash_result
 
-dashboard_service = DashboardService(db.session, "app/static/metrics.json")
+dashboard_service = DashboardService(db.session)
 admin_service = AdminService(db.session)
 listing_service = ListingService(db.session, dashboard_service)
 
@@ -18,6 +24,8 @@ admin = Blueprint('admin', __name__)
 @admin.route('/view_users')
 @login_required
 @admin_required
+@read_only
+@conditional_get('user', 'listing', 'loan')
 def view_users():
     """ GET Route to view users for the admin page manage users """
     args = request.args
@@ -25,6 +33,7 @@ def view_users():
     filter_role = args.get('filter_role')
     marked_for_deletion = args.get('marked_for_deletion')
     search = args.get('search')
+    cursor = args.get('cursor')
     
 #Sort by join_date: default descending
     if sort_join_date not in ('asc', 'desc'):
@@ -35,18 +44,21 @@ def view_users():
         search=search,
         sort_join_date=sort_join_date,
         filter_role=filter_role,
-        marked_for_deletion=marked_for_deletion
+        marked_for_deletion=marked_for_deletion,
+        cursor=cursor,
+        page_size=current_app.config['PAGE_SIZE']
     )
     if not user_result.success:
         flash(user_result.message, 'danger')
-        users = []
+        users, page = [], None
     else:
-        users = user_result.data
+        users, page = user_result.data.items, user_result.data
 
     metrics = dashboard_service.read_metrics(current_user)
     return render_template(
         'view_users.html',
         users=users,
+        page=page,
         metrics=metrics,
         search=search,
         sort_join_date=sort_join_date,
@@ -214,3 +226,32 @@ def admin_edit_user():
             return render_template('view_users.html', users=users, user=user)
 
     return render_template('view_users.html', user=user)
+
+
+@admin.route('/system_stats')
+@login_required
+@admin_required
+def system_stats():
+    """GET route returning runtime statistics as JSON for monitoring, admins only """
+    return jsonify(**runtime_stats())
+
+
+@admin.route('/performance')
+@login_required
+@admin_required
+def performance():
+    """GET route showing per-route latency percentiles and query costs, admins only """
+    return render_template('performance.html', **runtime_stats())
+
+
+def runtime_stats():
+    """Request timings per endpoint plus the password hashing pool and cache counters """
+    return {
+        "requests": request_metrics.summary(),
+        "password_hashing": hashing_pool.stats(),
+        "caches": {
+            "site_metrics": site_metrics_cache.stats(),
+            "user_snapshots": user_snapshot_cache.stats(),
+            "listing_cards": listing_card_cache.stats(),
+        },
+    }
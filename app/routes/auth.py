@@ -4,15 +4,16 @@ from flask_login import login_user, logout_user, current_user, login_required
 from app.services.user_service import UserService
 from app.services.dashboard_service import DashboardService
 from app.extensions import db
-from app.utils import flash_result
+from app.utils import flash_result, rate_limited
 
 
 auth = Blueprint('auth', __name__)
-dashboard_service = DashboardService(db.session, "app/static/metrics.json")
+dashboard_service = DashboardService(db.session)
 user_service = UserService(db.session)
 
 
 @auth.route('/register', methods=['GET', 'POST'])
+@rate_limited
 def register():
     """ Route to POST details from the register form """
 
@@ -39,6 +40,7 @@ def register():
     return render_template('login.html', show_register=False, metrics=metrics)
 
 @auth.route('/login', methods=['GET', 'POST'])
+@rate_limited
 def login():
     """Route to POST details from the login form """
 
@@ -71,11 +73,18 @@ def edit_user():
         form_data = request.form
         form_type = form_data.get('form_type')
 
+        #current_user is a cached snapshot, changes are made to the full record
+        user_result = user_service.get_user_by_id(current_user.user_id)
+        if not user_result.success:
+            flash_result(user_result)
+            return redirect(url_for('auth.login'))
+        user = user_result.data
+
     #Checks if the user wants to request deletion
         if form_type == 'delete':
             marked_for_deletion = form_data.get('marked_for_deletion')
             result = user_service.update_user(
-                current_user,
+                user,
                 None,
                 None,
                 None,
@@ -94,7 +103,7 @@ def edit_user():
             marked_for_deletion = form_data.get('marked_for_deletion', None)
 
             result = user_service.update_user(
-                current_user,
+                user,
                 new_username,
                 old_password,
                 new_password,
@@ -1,11 +1,13 @@
 from flask import Blueprint, render_template
 from flask_login import login_required, current_user
 from app.services import dashboard_service
+from app.utils import read_only
 
 dash = Blueprint('dash', __name__)
 
 @dash.route('/dashboard')
 @login_required
+@read_only
 def dashboard():
     """Dashboard view route, displays user and site metrics"""
     
@@ -1,11 +1,12 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
 from flask_login import login_required, current_user
 from datetime import date
 from app.models import Listing, Loan
 from app.services import listing_service, dashboard_service
 from app.services.listing_service import ListingService
 from app.extensions import db
-from app.utils import flash_result
+from app.utils import flash_result, read_only
+from app.etags import conditional_get
 from app.services.validators import to_bool
 
 listings = Blueprint('listings', __name__)
@@ -46,6 +47,8 @@ def create_listing():
 
 @listings.route('/view_listings', methods=['GET'])
 @login_required
+@read_only
+@conditional_get('listing', 'loan', 'user', 'genre')
 def view_all():
     """View all listings with optional filters and sorting,
     passes scope to define the view the user sees before or after an action"""
@@ -55,8 +58,10 @@ def view_all():
     search_query = args.get('search')
     genre_filter = args.get('genre')
     availability_filter = args.get('availability')
-    sort_order = args.get('sort', 'desc')
+    #Searches list the best matches first unless another order is picked
+    sort_order = args.get('sort', 'relevance' if search_query else 'desc')
     marked_for_deletion_raw = args.get('marked_for_deletion')
+    cursor = args.get('cursor')
 
     #Convert filters to appropriate types 
     marked_for_deletion = to_bool(marked_for_deletion_raw) if marked_for_deletion_raw else None
@@ -70,7 +75,10 @@ def view_all():
         availability=availability,
         search=search_query,
         sort_order=sort_order,
-        marked_for_deletion=marked_for_deletion
+        marked_for_deletion=marked_for_deletion,
+        render_profile='card_history' if scope == 'self' else 'card',
+        cursor=cursor,
+        page_size=current_app.config['PAGE_SIZE']
     )
     #Fetch genre options for the filter
     genres_result = listing_service.get_all_genres()
@@ -79,7 +87,8 @@ def view_all():
 
     return render_template(
         'view_books.html',
-        listings=result.data,
+        listings=result.data.items,
+        page=result.data,
         scope=scope,
         search=search_query,
         genre=genre_filter,
@@ -198,6 +207,8 @@ def mark_for_deletion():
 
 @listings.route('/view_loans')
 @login_required
+@read_only
+@conditional_get('loan', 'listing', 'user', 'genre')
 def view_loans():
     """View loan records with optional filters; admins view can see all, users see their own """
 
@@ -207,20 +218,23 @@ def view_loans():
     status = args.get('status')
     search = args.get('search')
     sort_order = args.get('sort', 'desc')
+    cursor = args.get('cursor')
+    page_size = current_app.config['PAGE_SIZE']
 
     #Scope logic to show users and admins the correct loan records  
     if scope == 'all' and current_user.is_admin:
-        result = listing_service.get_all_loans(status=status, search=search, sort_order=sort_order)
+        result = listing_service.get_all_loans(status=status, search=search, sort_order=sort_order,
+                                               cursor=cursor, page_size=page_size)
     else:
-        result = listing_service.get_all_loans(current_user.user_id, status=status, search=search, sort_order=sort_order)
+        result = listing_service.get_all_loans(current_user.user_id, status=status, search=search, sort_order=sort_order,
+                                               cursor=cursor, page_size=page_size)
 
-    listings_data = listing_service.get_all_listings()
     today = date.today()
 
     return render_template(
         'view_loans.html',
-        loans=result.data,
-        listings=listings_data,
+        loans=result.data.items,
+        page=result.data,
         today=today,
         scope=scope,
         status=status,
@@ -0,0 +1,259 @@
+from collections import Counter
+from datetime import date
+from functools import lru_cache
+from itertools import accumulate
+from flask.cli import with_appcontext
+from sqlalchemy import insert, update, select, func, bindparam
+from app.extensions import db
+from app.models import User, Genre, Listing, Loan, SiteCounter
+from app.passwords import hash_password
+from app.search import listing_fts_suspended
+from app.etags import bump_change_counters
+from app.services.dashboard_service import site_metrics_cache
+import click
+import logging
+import random
+import time
+
+# Genres created when the database has none, in order of popularity
+SCALE_GENRES = [
+    ("Fantasy", "images/fantasy.png"),
+    ("Mystery", "images/mystery.png"),
+    ("Romance", "images/romance.png"),
+    ("Thriller", "images/horror.png"),
+    ("Science Fiction", "images/science.png"),
+    ("Children", "images/children.png"),
+    ("Non-Fiction", "images/science.png"),
+    ("History", "images/adventure.png"),
+    ("Horror", "images/horror.png"),
+    ("Adventure", "images/adventure.png"),
+]
+
+_ADJECTIVES = ["Silent", "Hidden", "Lost", "Crimson", "Last", "Broken", "Golden", "Secret", "Distant",
+               "Forgotten", "Burning", "Quiet", "Wild", "Northern", "Midnight", "Glass", "Iron", "Winter"]
+_NOUNS = ["River", "Garden", "Empire", "Shadow", "Kingdom", "Letter", "Harbour", "Forest", "Voyage",
+          "Museum", "Island", "Promise", "Station", "Crown", "Orchard", "Machine", "Lighthouse", "Storm"]
+_FIRST_NAMES = ["Emily", "John", "Sophie", "Nathan", "Clive", "Sally", "Rachel", "Fred", "Mel", "Jess",
+                "Terry", "Philip", "Charlotte", "Lewis", "Shelly", "Bob", "Sam", "Chantelle"]
+_LAST_NAMES = ["Hart", "Doyle", "Baxter", "Anderson", "Bean", "Dale", "Lovett", "Jones", "Smith",
+               "King", "Carroll", "Pratchett", "Peter", "Dick", "Moss", "Reed", "Walsh", "Quinn"]
+
+_TITLES = [f"The {adjective} {noun}" for adjective in _ADJECTIVES for noun in _NOUNS]
+_AUTHORS = [f"{first} {last}" for first in _FIRST_NAMES for last in _LAST_NAMES]
+_DESCRIPTIONS = [f"A {adjective.lower()} story of the {noun.lower()}." for adjective in _ADJECTIVES for noun in _NOUNS]
+
+# Every generated user logs in with this password
+SCALE_PASSWORD = "Password123"
+
+# Column order of the generated rows
+_USER_COLUMNS = ("user_id", "username", "username_normalized", "password_hash", "role",
+                 "marked_for_deletion", "total_listings", "total_loans", "join_date")
+_LISTING_COLUMNS = ("listing_id", "title", "author", "description", "genre_id", "is_available",
+                    "marked_for_deletion", "user_id", "date_listed", "version")
+_LOAN_COLUMNS = ("loan_id", "listing_id", "user_id", "start_date", "return_date",
+                 "actual_return_date", "is_returned")
+
+
+def _skewed_weights(rng, count, alpha):
+    """Cumulative Pareto weights (for random.choices), so a few records get most of the activity"""
+    return list(accumulate(rng.paretovariate(alpha) for _ in range(count)))
+
+
+@lru_cache(maxsize=None)
+def _iso_date(day):
+    """ISO string for a date ordinal, the few thousand distinct days are formatted once each"""
+    return date.fromordinal(day).isoformat()
+
+
+def _next_id(connection, column):
+    return (connection.execute(select(func.max(column))).scalar() or 0) + 1
+
+
+def _bulk_inserter(connection, table, columns):
+    """Return a function that INSERTs a list of row tuples (in `columns` order) with one executemany
+    straight on the DB-API cursor. SQLAlchemy's per-row parameter processing is skipped,
+    so dates must already be ISO strings"""
+
+    compiled = insert(table).compile(dialect=connection.dialect, column_keys=list(columns))
+    statement = str(compiled)
+    if compiled.positional:
+        order = [columns.index(key) for key in compiled.positiontup]
+        in_order = order == list(range(len(columns)))
+
+        def to_params(rows):
+            return rows if in_order else [tuple(row[i] for i in order) for row in rows]
+    else:
+        def to_params(rows):
+            return [dict(zip(columns, row)) for row in rows]
+
+    def insert_rows(rows):
+        if rows:
+            connection.exec_driver_sql(statement, to_params(rows))
+    return insert_rows
+
+
+def _secondary_indexes(*models):
+    """Non-unique indexes of the given tables, dropped during a bulk load and rebuilt once afterwards"""
+    return [index for model in models for index in model.__table__.indexes if not index.unique]
+
+
+def _username_prefix(connection):
+    """A prefix for the generated usernames that no existing username starts with,
+    so a seed run never collides with real users or with an earlier run ("reader", then "reader2_", ...)"""
+    prefix, run = "reader", 1
+    while connection.execute(
+            select(User.user_id).where(User.username_normalized.startswith(prefix, autoescape=True)).limit(1)
+    ).first():
+        run += 1
+        prefix = f"reader{run}_"
+    return prefix
+
+
+def _genre_ids(connection):
+    """IDs of the existing genres, creating the default ones in an empty database"""
+    genre_ids = connection.execute(select(Genre.genre_id).order_by(Genre.genre_id)).scalars().all()
+    if not genre_ids:
+        connection.execute(insert(Genre.__table__), [
+            {"name": name, "name_normalized": name.lower(), "image": image} for name, image in SCALE_GENRES
+        ])
+        genre_ids = connection.execute(select(Genre.genre_id).order_by(Genre.genre_id)).scalars().all()
+    return genre_ids
+
+
+def seed_scale(engine, users=1000, listings=10000, loans=20000, on_loan=0.25,
+               batch_size=10000, seed=None, today=None):
+    """Bulk-generate users, listings and loan histories with batched executemany INSERTs.
+    Owners, borrowers, genres and loan counts are skewed so a few of each are much busier than the rest.
+    on_loan is the share of listings with a loan history whose latest loan is still out.
+    Returns the number of rows added to each table"""
+
+    rng = random.Random(seed)
+    rand = rng.random
+    today = (today or date.today()).toordinal()
+    # One hash shared by every generated user instead of one hash per row
+    password_hash = hash_password(SCALE_PASSWORD)
+
+    with listing_fts_suspended(engine), engine.begin() as connection:
+        genre_ids = _genre_ids(connection)
+        first_user = _next_id(connection, User.user_id)
+        username_prefix = _username_prefix(connection)
+        first_listing = _next_id(connection, Listing.listing_id)
+        next_loan = _next_id(connection, Loan.loan_id)
+        insert_users = _bulk_inserter(connection, User.__table__, _USER_COLUMNS)
+        insert_listings = _bulk_inserter(connection, Listing.__table__, _LISTING_COLUMNS)
+        insert_loans = _bulk_inserter(connection, Loan.__table__, _LOAN_COLUMNS)
+
+        # Building an index once over the loaded rows is much cheaper than updating it per row.
+        # Only on SQLite, where DDL is transactional and foreign keys don't need their own indexes
+        indexes = _secondary_indexes(User, Listing, Loan) if connection.dialect.name == 'sqlite' else []
+        for index in indexes:
+            index.drop(connection)
+
+        # Every owner, borrower and loan count is drawn up front, so the users can be written
+        # with their all-time totals before the listings and loans that refer to them
+        user_ids = range(first_user, first_user + users)
+        owners = rng.choices(user_ids, cum_weights=_skewed_weights(rng, users, 1.2), k=listings)
+        borrowers = rng.choices(user_ids, cum_weights=_skewed_weights(rng, users, 2.0), k=loans)
+        loan_counts = Counter(rng.choices(range(listings), cum_weights=_skewed_weights(rng, listings, 1.5), k=loans))
+        listing_totals, loan_totals = Counter(owners), Counter(borrowers)
+        join_days = [today - int(rand() * 3 * 365) for _ in user_ids]
+
+        for batch_start in range(0, users, batch_size):
+            insert_users([
+                (user_id, f"{username_prefix}{user_id}", f"{username_prefix}{user_id}", password_hash,
+                 "admin" if rand() < 0.01 else "regular", rand() < 0.005,
+                 listing_totals[user_id], loan_totals[user_id],
+                 _iso_date(join_days[user_id - first_user]))
+                for user_id in user_ids[batch_start:batch_start + batch_size]
+            ])
+
+        # Listings are written a batch at a time, each batch followed by the loans that belong to it
+        genre_weights = list(accumulate(1 / rank for rank in range(1, len(genre_ids) + 1)))
+        borrower_iter = iter(borrowers)
+        active_loans = []
+        for batch_start in range(0, listings, batch_size):
+            batch_end = min(batch_start + batch_size, listings)
+            size = batch_end - batch_start
+            genres = rng.choices(genre_ids, cum_weights=genre_weights, k=size)
+            titles = rng.choices(_TITLES, k=size)
+            authors = rng.choices(_AUTHORS, k=size)
+            descriptions = rng.choices(_DESCRIPTIONS, k=size)
+            listing_rows, loan_rows = [], []
+
+            for offset, index in enumerate(range(batch_start, batch_end)):
+                listing_id = first_listing + index
+                owner = owners[index]
+                joined = join_days[owner - first_user]
+                history = loan_counts.get(index, 0)
+                out_on_loan = history > 0 and rand() < on_loan
+
+                # Loans run back to back, the newest first, ending today for a listing out on loan
+                end = today if out_on_loan else today - 1 - int(rand() * 59)
+                for position in range(history):
+                    start = end - 7 - int(rand() * 28)
+                    returned = not (out_on_loan and position == 0)
+                    loan_rows.append((
+                        next_loan, listing_id, next(borrower_iter),
+                        _iso_date(start), _iso_date(start + 28), _iso_date(end) if returned else None, returned,
+                    ))
+                    if not returned:
+                        active_loans.append({"b_listing_id": listing_id, "b_loan_id": next_loan})
+                    next_loan += 1
+                    end = start - int(rand() * 30)
+
+                listing_rows.append((
+                    listing_id, titles[offset], authors[offset], descriptions[offset], genres[offset],
+                    not out_on_loan, rand() < 0.01, owner, _iso_date(joined + int(rand() * (today - joined + 1))), 1,
+                ))
+
+            insert_listings(listing_rows)
+            for loan_start in range(0, len(loan_rows), batch_size):
+                insert_loans(loan_rows[loan_start:loan_start + batch_size])
+
+        for index in indexes:
+            index.create(connection)
+
+        # Point each listing that is out on loan at its loan
+        if active_loans:
+            listing_table = Listing.__table__
+            connection.execute(
+                update(listing_table)
+                .where(listing_table.c.listing_id == bindparam("b_listing_id"))
+                .values(active_loan_id=bindparam("b_loan_id")),
+                active_loans
+            )
+
+        for name, amount in (("total_overall_books", listings), ("total_overall_loans", loans)):
+            connection.execute(
+                update(SiteCounter.__table__).where(SiteCounter.name == name)
+                .values(value=SiteCounter.value + amount)
+            )
+        bump_change_counters(connection, ('user', 'genre', 'listing', 'loan'))
+
+    site_metrics_cache.invalidate()
+    return {"users": users, "listings": listings, "loans": loans, "active_loans": len(active_loans)}
+
+
+@click.command('seed-scale')
+@click.option('--users', type=click.IntRange(min=1), default=1000, show_default=True, help="Users to create.")
+@click.option('--listings', type=click.IntRange(min=1), default=10000, show_default=True, help="Listings to create.")
+@click.option('--loans', type=click.IntRange(min=0), default=20000, show_default=True,
+              help="Loans to create across the listings.")
+@click.option('--on-loan', type=click.FloatRange(0, 1), default=0.25, show_default=True,
+              help="Share of listings with a loan history that are currently out on loan.")
+@click.option('--batch-size', type=click.IntRange(min=1), default=10000, show_default=True, help="Rows per INSERT batch.")
+@click.option('--seed', type=int, default=None, help="Random seed, for a repeatable data set.")
+@with_appcontext
+def seed_scale_command(users, listings, loans, on_loan, batch_size, seed):
+    """Bulk-generate a large catalogue of users, listings and loans for load testing"""
+    started = time.perf_counter()
+    try:
+        counts = seed_scale(db.engine, users=users, listings=listings, loans=loans,
+                            on_loan=on_loan, batch_size=batch_size, seed=seed)
+    except Exception as e:
+        logging.error(f"Scale seeding failed: {e}")
+        raise click.ClickException(f"Scale seeding failed: {e}")
+
+    click.echo(f"Added {counts['users']} users, {counts['listings']} listings and {counts['loans']} loans "
+               f"({counts['active_loans']} out on loan) in {time.perf_counter() - started:.1f}s.")
+    click.echo(f"Every generated user's password is {SCALE_PASSWORD}.")
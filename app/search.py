@@ -0,0 +1,170 @@
+from contextlib import contextmanager
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+from sqlalchemy import text, select, literal_column, table, Float
+from sqlalchemy.exc import OperationalError
+from app.extensions import db
+import click
+import logging
+import re
+
+# Name of the SQLite FTS5 table that mirrors listing title, author and description
+FTS_TABLE = 'listing_fts'
+
+# External-content FTS5 table plus triggers that keep it in step with the listing table
+_FTS_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, author, description,
+        content='listing', content_rowid='listing_id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON listing BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author, description)
+        VALUES (new.listing_id, new.title, new.author, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON listing BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, description)
+        VALUES ('delete', old.listing_id, old.title, old.author, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF title, author, description ON listing BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, description)
+        VALUES ('delete', old.listing_id, old.title, old.author, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, author, description)
+        VALUES (new.listing_id, new.title, new.author, new.description);
+    END""",
+]
+
+# Triggers that copy listing changes into the FTS table
+_FTS_TRIGGERS = tuple(f"{FTS_TABLE}_{action}" for action in ('insert', 'delete', 'update'))
+
+# Column weights for bm25 ranking: title matches count most, then author, then description
+_RANK_WEIGHTS = (10.0, 5.0, 1.0)
+
+
+def install_listing_fts(engine):
+    """Create the listing FTS index and its triggers if the database supports FTS5.
+    A newly created index is populated from the existing listings.
+    Returns True when full-text search is available"""
+
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": FTS_TABLE}
+            ).first()
+            for statement in _FTS_SCHEMA:
+                conn.execute(text(statement))
+            if not exists:
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        return True
+    except OperationalError as e:
+        # SQLite builds without FTS5 fall back to LIKE searches
+        logging.error(f"Full-text search unavailable, falling back to LIKE: {e}")
+        return False
+
+
+def drop_listing_fts(engine):
+    """Remove the listing FTS index and its triggers (used when the listing table is dropped)"""
+    if engine.dialect.name != 'sqlite':
+        return
+    with engine.begin() as conn:
+        _drop_fts_triggers(conn)
+        conn.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+
+
+def _drop_fts_triggers(conn):
+    for trigger in _FTS_TRIGGERS:
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+
+
+@contextmanager
+def listing_fts_suspended(engine):
+    """Stop the FTS triggers for a bulk load into the listing table.
+    Afterwards the triggers are restored and the index is rebuilt once, instead of row by row"""
+
+    with engine.begin() as conn:
+        installed = engine.dialect.name == 'sqlite' and conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE}
+        ).first() is not None
+        if installed:
+            _drop_fts_triggers(conn)
+    try:
+        yield
+    finally:
+        if installed:
+            install_listing_fts(engine)
+            with engine.begin() as conn:
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def rebuild_listing_fts(db_session):
+    """Rebuild the listing FTS index from the listing table"""
+    db_session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    db_session.commit()
+
+
+def fts_enabled():
+    """Check if full-text search was installed for the current app"""
+    return has_app_context() and current_app.config.get('LISTING_FTS_ENABLED', False)
+
+
+def build_match_query(search):
+    """Turn free text into an FTS5 prefix query, every word must match the start of a token.
+    Returns None if the text contains no searchable words"""
+    words = re.findall(r'\w+', search or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _match_condition(search):
+    """FTS5 MATCH condition for the search text, or None if it contains no searchable words"""
+    match_query = build_match_query(search)
+    if match_query is None:
+        return None
+    return text(f"{FTS_TABLE} MATCH :match_query").bindparams(match_query=match_query)
+
+
+def matching_listing_ids(search):
+    """Return a SELECT of listing IDs matching the search text,
+    or None when the search should fall back to LIKE"""
+    if not fts_enabled():
+        return None
+
+    condition = _match_condition(search)
+    if condition is None:
+        return None
+    return select(literal_column('rowid')).select_from(table(FTS_TABLE)).where(condition)
+
+
+def ranked_listing_matches(search):
+    """Return a subquery of (listing_id, search_rank) for the listings matching the search text,
+    a lower bm25 rank being a better match. None when the search should fall back to LIKE"""
+    if not fts_enabled():
+        return None
+
+    condition = _match_condition(search)
+    if condition is None:
+        return None
+    weights = ', '.join(str(weight) for weight in _RANK_WEIGHTS)
+    return (
+        select(literal_column('rowid').label('listing_id'),
+               literal_column(f"bm25({FTS_TABLE}, {weights})", Float).label('search_rank'))
+        .select_from(table(FTS_TABLE))
+        .where(condition)
+        .subquery()
+    )
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Rebuild the listing full-text index for an existing database"""
+    if not install_listing_fts(db.engine):
+        click.echo("Full-text search is not supported by this database, LIKE search will be used.")
+        return
+    rebuild_listing_fts(db.session)
+    click.echo("Listing search index rebuilt.")
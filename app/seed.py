@@ -1,6 +1,6 @@
 from app.extensions import db
 from app.models import User, Genre, Listing, Loan
-from werkzeug.security import generate_password_hash
+from app.passwords import hash_password
 from app import create_app
 from datetime import date
 
@@ -159,7 +159,7 @@ def seeding():
             ]
 
             for i in users:
-                hashed_password = generate_password_hash(i["password"])
+                hashed_password = hash_password(i["password"])
                 user = User(
                     username=i["username"],
                     password_hash=hashed_password,
@@ -458,4 +458,7 @@ def seeding():
                     is_returned=i["is_returned"]
                 )
                 db.session.add(loan)
+            db.session.flush()
+            #Point each listing at its unreturned loan
+            Listing.repair_active_loans(db.session)
             db.session.commit()
@@ -3,22 +3,23 @@ from app.utils import Result
 from app.services.validators import validate_non_empty_string
 import logging
 from app.services.validators import validate_length
+from app.services.base import BaseService
+from app.services.user_service import user_snapshot_cache
 
 
-class AdminService:
+class AdminService(BaseService):
 
-    def __init__(self, db_session):
-        #Dependency injection of the database session 
-        self.db_session = db_session
-
-    def view_users(self, search=None, sort_join_date='desc', filter_role=None, marked_for_deletion=None):
-        """Retrieves a list of users with optional filtering, sorting, and search"""
+    def view_users(self, search=None, sort_join_date='desc', filter_role=None, marked_for_deletion=None, cursor=None, page_size=None):
+        """Retrieves a list of users with optional filtering, sorting, and search.
+        When page_size is given the data is a Page starting at the cursor"""
         users = User.filter_search_query(
             db_session=self.db_session,
             search=search,
             filter_role=filter_role,
             marked_for_deletion=marked_for_deletion,
-            sort_join_date=sort_join_date
+            sort_join_date=sort_join_date,
+            cursor=cursor,
+            page_size=page_size
         )
         return Result(True, "Users retrieved successfully", users)
 
@@ -55,7 +56,9 @@ class AdminService:
                         "danger")
 
             user.role = role
-            user.save(self.db_session)
+            with self.transaction():
+                user.save(self.db_session)
+            user_snapshot_cache.invalidate(user.user_id)
             return Result(True, "User role updated successfully.")
 
         except Exception as e:
@@ -80,7 +83,10 @@ class AdminService:
                         return Result(False,
                                     "Cannot delete the last remaining admin. Please appoint another admin first.")
 
-            record.delete(self.db_session)
+            with self.transaction():
+                record.delete(self.db_session)
+            if model_class == User:
+                user_snapshot_cache.invalidate(record_id)
             return Result(True, "Record deleted successfully")
         except Exception as e:
             logging.error(f"Error deleting record ID {record_id} of type {model_class.__name__}: {str(e)}")
@@ -109,7 +115,8 @@ class AdminService:
             image=image,
         )
         try:
-            new_genre.save(self.db_session)
+            with self.transaction():
+                new_genre.save(self.db_session)
             return Result(True, "Genre created successfully")
         except Exception as e:
             logging.error(f"Error creating genre '{name}': {str(e)}")
@@ -151,7 +158,8 @@ class AdminService:
         genre.name = name
         genre.image = image
         try:
-            genre.save(self.db_session)
+            with self.transaction():
+                genre.save(self.db_session)
             return Result(True, "Genre updated successfully")
         except Exception as e:
             logging.error(f"Error updating genre ID {genre_id}: {str(e)}")
@@ -0,0 +1,28 @@
+from contextlib import contextmanager
+from app.models import UNIT_OF_WORK, in_unit_of_work
+
+
+class BaseService:
+
+    def __init__(self, db_session):
+        #Dependency injection of the database session
+        self.db_session = db_session
+
+    @contextmanager
+    def transaction(self):
+        """Unit of work: save() and delete() calls inside the block are only staged,
+        and everything is committed once on exit (or rolled back if an error is raised).
+        A nested block joins the transaction that is already open"""
+        if in_unit_of_work(self.db_session):
+            yield
+            return
+
+        self.db_session.info[UNIT_OF_WORK] = True
+        try:
+            yield
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            raise
+        finally:
+            self.db_session.info.pop(UNIT_OF_WORK, None)
@@ -1,85 +1,178 @@
-from app.utils import Result
+from app.utils import Result, TTLCache
 import json
-from app.models import Listing, Loan
+import logging
+import os
+from sqlalchemy import select, func, case, and_, true, event
+from sqlalchemy.orm import Session
+from app.models import User, Listing, Loan, SiteCounter
+from app.services.base import BaseService
 
+# Site-wide running totals kept in the site_counter table
+SITE_COUNTERS = ('total_overall_books', 'total_overall_loans')
 
-class DashboardService:
+# Metrics that are the same for every visitor and can be shared between requests
+SITE_METRICS = SITE_COUNTERS + ('active_loans', 'listed_books', 'available_books')
 
-    def __init__(self, db_session, metrics_file_path):
-        """ Initialises the DashboardService with a database session and a path to the metrics JSON file """
-        self.db_session = db_session
-        self.metrics_file = metrics_file_path
+# Process-wide cache of the site metrics, the TTL is set from METRICS_CACHE_TTL in create_app
+site_metrics_cache = TTLCache()
+
+# Models whose changes alter the site metrics
+_METRIC_MODELS = (Listing, Loan, SiteCounter)
+
+# Models whose deletion cascades to listings and loans in the database, which the session never sees
+_CASCADING_MODELS = (User,)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_metric_changes(session, flush_context):
+    """Remember when a flush wrote listings, loans or counters, or deleted a user owning them"""
+    changed = (*session.new, *session.dirty, *session.deleted)
+    if (any(isinstance(instance, _METRIC_MODELS) for instance in changed)
+            or any(isinstance(instance, _CASCADING_MODELS) for instance in session.deleted)):
+        session.info["site_metrics_changed"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_metric_statements(orm_execute_state):
+    """Remember bulk UPDATE/DELETE statements against listings, loans or counters, and bulk user deletes"""
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and (issubclass(mapper.class_, _METRIC_MODELS)
+                                   or orm_execute_state.is_delete and issubclass(mapper.class_, _CASCADING_MODELS)):
+            orm_execute_state.session.info["site_metrics_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_site_metrics(session):
+    """Drop the cached site metrics once a change to them is committed"""
+    if session.info.pop("site_metrics_changed", False):
+        site_metrics_cache.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_metric_changes(session):
+    session.info.pop("site_metrics_changed", None)
+
+
+class DashboardService(BaseService):
 
     def read_metrics(self, user=None):
-        """ Reads metrics from the JSON file. If a user is provided, their personal statistics
-        and system-wide counts are also added to the result """
+        """ Reads the site-wide metrics, served from a short-lived cache when possible.
+        If a user is provided, their personal statistics are also added to the result """
 
         try:
-            # Load existing metrics from the JSON file
-            with open(self.metrics_file, "r") as f:
-                data = json.load(f)
+            site_metrics = site_metrics_cache.get("site")
 
             if user:
-                # Add user's listing/loan totals (from model properties or fallback to 0)
-                data["user_total_listings"] = getattr(user, "total_listings", 0) or 0
-                data["user_total_loans"] = getattr(user, "total_loans", 0) or 0
-
-                # Query live counts for user's active listings and loans
-                data["user_active_listings"] = Listing.count_by_user(
-                    self.db_session, user.user_id)
-                data["user_active_loans"] = Loan.count_active_by_user(
-                    self.db_session, user.user_id)
-
-                # Add system-wide counts for live dashboard display
-                data["active_loans"] = Loan.count_active(self.db_session)
-                data["listed_books"] = Listing.count_all(self.db_session)
-                data["available_books"] = Listing.count_available(self.db_session)
+                if site_metrics is None:
+                    # Site totals, live system-wide counts and the user's counts in one round trip
+                    data = self.aggregate_metrics(user.user_id)
+                    site_metrics_cache.set("site", {name: data[name] for name in SITE_METRICS})
+                else:
+                    data = dict(site_metrics, **self.user_metrics(user.user_id))
+            else:
+                if site_metrics is None:
+                    aggregate = self.aggregate_metrics(None)
+                    site_metrics = {name: aggregate[name] for name in SITE_METRICS}
+                    site_metrics_cache.set("site", site_metrics)
+                data = dict(site_metrics)
 
             return Result(True, "Metrics read successfully", data)
 
         except Exception as e:
-            # Catch any file read or JSON parsing errors
             return Result(False, f"Error reading metrics: {e}")
 
+    @staticmethod
+    def _user_totals(user_id):
+        """ Scalar subqueries for the user's all-time listing and loan totals """
+        return [
+            func.coalesce(select(column).where(User.user_id == user_id).scalar_subquery(), 0).label(label)
+            for column, label in ((User.total_listings, "user_total_listings"),
+                                  (User.total_loans, "user_total_loans"))
+        ]
+
+    def user_metrics(self, user_id):
+        """ Returns the user's active and all-time listing and loan counts from a single SELECT """
+        query = select(
+            select(func.count()).select_from(Listing)
+            .where(Listing.user_id == user_id)
+            .scalar_subquery().label("user_active_listings"),
+            select(func.count()).select_from(Loan)
+            .where(Loan.user_id == user_id, Loan.is_returned.is_(False))
+            .scalar_subquery().label("user_active_loans"),
+            *self._user_totals(user_id),
+        )
+        return dict(self.db_session.execute(query).mappings().one())
+
+    def aggregate_metrics(self, user_id):
+        """ Returns every dashboard count for a user from a single SELECT.
+        Each table is read once, with conditional SUMs splitting the rows into the separate counts """
+
+        def count_where(condition):
+            return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+        def counter_value(name):
+            return func.coalesce(func.max(case((SiteCounter.name == name, SiteCounter.value))), 0)
+
+        listing_stats = select(
+            func.count().label("listed_books"),
+            count_where(Listing.is_available.is_(True)).label("available_books"),
+            count_where(Listing.user_id == user_id).label("user_active_listings"),
+        ).subquery()
+
+        loan_stats = select(
+            count_where(Loan.is_returned.is_(False)).label("active_loans"),
+            count_where(and_(Loan.is_returned.is_(False), Loan.user_id == user_id)).label("user_active_loans"),
+        ).subquery()
+
+        counter_stats = select(
+            *(counter_value(name).label(name) for name in SITE_COUNTERS)
+        ).subquery()
+
+        query = (
+            select(listing_stats, loan_stats, counter_stats, *self._user_totals(user_id))
+            .select_from(listing_stats.join(loan_stats, true()).join(counter_stats, true()))
+        )
+        return dict(self.db_session.execute(query).mappings().one())
+
     def update_overall_listings(self):
-        """ Increments the total number of listings in the metrics JSON file.
-        Used when a new book is listed """
+        """ Increments the total number of listings. Used when a new book is listed.
+        The increment is not committed here, it is saved with the listing it counts """
 
         try:
-            # Read current metrics from the file
-            with open(self.metrics_file, "r") as f:
-                data = json.load(f)
-
-            # Increment the listing counter (initializes to 0 if missing)
-            data['total_overall_books'] = data.get('total_overall_books', 0) + 1
-
-            # Write updated metrics back to the file
-            with open(self.metrics_file, "w") as f:
-                json.dump(data, f, indent=4)
-
+            SiteCounter.increment(self.db_session, 'total_overall_books')
             return Result(True, "Overall listings updated")
 
         except Exception as e:
-            return Result(False, f"Error updating metrics JSON: {e}")
-        
+            return Result(False, f"Error updating metrics: {e}")
+
     def update_overall_loans(self):
         """
-        Increments the total number of loans in the metrics JSON file.
-        Used when a loan is successfully created.
+        Increments the total number of loans. Used when a loan is successfully created.
+        The increment is not committed here, it is saved with the loan it counts.
         """
         try:
-            # Read current metrics from the file
-            with open(self.metrics_file, "r") as f:
-                data = json.load(f)
+            SiteCounter.increment(self.db_session, 'total_overall_loans')
+            return Result(True, "Overall loans updated")
+
+        except Exception as e:
+            return Result(False, f"Error updating metrics: {e}")
 
-            # Increment the loan counter (initializes to 0 if missing)
-            data['total_overall_loans'] = data.get('total_overall_loans', 0) + 1
+    def import_metrics_file(self, metrics_file_path):
+        """ One-time import of the totals from the legacy metrics JSON file.
+        Only runs while the counters table is empty, later calls just ensure the counters exist """
 
-            # Write updated metrics back to the file
-            with open(self.metrics_file, "w") as f:
-                json.dump(data, f, indent=4)
+        try:
+            initial_values = {}
+            if (metrics_file_path and os.path.exists(metrics_file_path)
+                    and not self.db_session.query(SiteCounter).first()):
+                with open(metrics_file_path, "r") as f:
+                    initial_values = json.load(f)
 
-            return Result(True, "Overall loans updated")
+            SiteCounter.ensure_exists(self.db_session, SITE_COUNTERS, initial_values)
+            return Result(True, "Metrics imported")
 
         except Exception as e:
-            return Result(False, f"Error updating metrics JSON: {e}")
+            self.db_session.rollback()
+            logging.error(f"Error importing metrics from {metrics_file_path}: {e}")
+            return Result(False, f"Error importing metrics: {e}")
@@ -3,11 +3,13 @@ from app.utils import Result
 from datetime import date, timedelta
 from app.services.validators import validate_non_empty_string, to_bool, validate_length
 from flask_login import current_user
+from sqlalchemy import func
+from app.services.base import BaseService
 
 
-class ListingService:
+class ListingService(BaseService):
     def __init__(self, db_session, dashboard_service):
-        self.db_session = db_session
+        super().__init__(db_session)
         self.dashboard_service = dashboard_service
 
     def list_book(self, title, author, description, genre_id, user_id, is_available=True):
@@ -45,16 +47,20 @@ class ListingService:
                 return user_result
             user = user_result.data
 
-            user.increment_totals(self.db_session)
-            new_listing.save(self.db_session)
-            self.dashboard_service.update_overall_listings()
+            #The user's total, the site total and the listing are committed together
+            with self.transaction():
+                user.increment_totals(self.db_session)
+                self.dashboard_service.update_overall_listings()
+                new_listing.save(self.db_session)
 
             return Result(True, "Listing created successfully", new_listing)
         except Exception as e:
             return Result(False, f"Error creating Listing: {str(e)}")
 
-    def get_all_listings(self, user_id=None, genre=None, availability=None, search=None, sort_order='desc', marked_for_deletion=None):
-        """ Method to retrive listings with optional filter options applied """
+    def get_all_listings(self, user_id=None, genre=None, availability=None, search=None, sort_order='desc', marked_for_deletion=None, render_profile=None, cursor=None, page_size=None):
+        """ Method to retrive listings with optional filter options applied,
+        render_profile selects which relationships are eager-loaded for the template.
+        When page_size is given the data is a Page starting at the cursor """
 
         query = Listing.filter_search_listings(
             db_session=self.db_session,
@@ -63,7 +69,10 @@ class ListingService:
             filter_genre=genre,
             filter_availability=availability,
             sort_order=sort_order,
-            marked_for_deletion=marked_for_deletion
+            marked_for_deletion=marked_for_deletion,
+            render_profile=render_profile,
+            cursor=cursor,
+            page_size=page_size
         )
 
         return Result(True, "Listings returned successfully.", query)
@@ -149,7 +158,8 @@ class ListingService:
 
                 listing.is_available = new_availability
 
-            listing.save(self.db_session)
+            with self.transaction():
+                listing.save(self.db_session)
             return Result(True, "Listing updated successfully")
 
         except ValueError as ve:
@@ -169,20 +179,24 @@ class ListingService:
 
         try:
             listing.marked_for_deletion = to_bool(is_marked)
-            listing.save(self.db_session)
+            with self.transaction():
+                listing.save(self.db_session)
             return Result(True, "Listing deletion status updated.")
         except Exception as e:
             return Result(False, f"Error updating deletion status: {str(e)}")
 
-    def get_all_loans(self, user_id=None, status=None, sort_order='desc', search=None):
-        """Retrives all loans with the optional filters """
+    def get_all_loans(self, user_id=None, status=None, sort_order='desc', search=None, cursor=None, page_size=None):
+        """Retrives all loans with the optional filters,
+        when page_size is given the data is a Page starting at the cursor """
 
         loans = Loan.filter_search_loans(
             db_session=self.db_session,
             filter_status=status,
             search=search,
             sort_order=sort_order,
-            user_id=user_id
+            user_id=user_id,
+            cursor=cursor,
+            page_size=page_size
         )
 
         return Result(True, "Loans retrieved successfully", loans)
@@ -199,21 +213,26 @@ class ListingService:
 
         try:
             #If a loan is marked as returned the availability becomes available 
-            loan.is_returned = True
-            loan.actual_return_date = actual_return_date
-
-            listing = loan.listing
-            if listing:
-                listing.is_available = True
-                listing.save(self.db_session)
-
-            loan.save(self.db_session)
+            with self.transaction():
+                loan.is_returned = True
+                loan.actual_return_date = actual_return_date
+
+                listing = loan.listing
+                if listing:
+                    listing.is_available = True
+                    if listing.active_loan_id == loan.loan_id:
+                        listing.current_loan = None
+                    listing.save(self.db_session)
+
+                loan.save(self.db_session)
             return Result(True, "Loan marked as returned"), loan
         except Exception as e:
             return Result(False, f"Error updating loan: {str(e)}"), None
 
     def reserve_book(self, user_id, listing_id):
-        """Reserves a book, marking it as unavailable and creates a new loan record """
+        """Reserves a book, marking it as unavailable and creates a new loan record.
+        The listing is claimed with a conditional UPDATE so only one of several concurrent
+        reservations succeeds, and all of the writes are saved in a single commit """
         try:
             #Logic to determine the loan period 
             start_date = date.today() + timedelta(days=1)
@@ -236,21 +255,24 @@ class ListingService:
             if not listing.is_available:
                 return Result(False, "Listing not available for reservation")
 
-            listing.is_available = False
-            listing.save(self.db_session)
-
-            #Updates users loan count 
             user_result = self.get_record_by_id(User, user_id)
             if not user_result.success:
                 return user_result  
             user = user_result.data
 
-            user.total_loans = (user.total_loans or 0) + 1
-            user.save(self.db_session)
+            with self.transaction():
+                #Claim the listing, the UPDATE only matches if nobody has reserved it since it was read.
+                #A lost claim wrote nothing, so leaving the block here only ends the transaction
+                if not Listing.claim_for_loan(self.db_session, listing_id):
+                    return Result(False, "Listing not available for reservation")
+
+                #Updates users loan count in SQL so concurrent reservations do not overwrite each other
+                user.total_loans = func.coalesce(User.total_loans, 0) + 1
 
-            loan.save(self.db_session)
-            #Updates the overall site loans
-            self.dashboard_service.update_overall_loans()
+                #Updates the overall site loans and the listing's current loan, committed together with the loan
+                self.dashboard_service.update_overall_loans()
+                listing.current_loan = loan
+                loan.save(self.db_session)
 
             return Result(True, "Book reserved successfully", loan)
         except Exception as e:
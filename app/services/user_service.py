@@ -1,15 +1,32 @@
-from werkzeug.security import generate_password_hash
-from app.models import User
-from app.utils import Result
+from app.models import User, UserSnapshot
+from app.utils import Result, TTLCache
 from flask_login import logout_user
 from app.services.validators import validate_non_empty_string, validate_length
 from datetime import date
+from app.services.base import BaseService
+from app.passwords import HashingBusy
+import logging
 import os
 
 
-class UserService:
-    def __init__(self, db_session):
-        self.db_session = db_session
+# Process-wide cache of logged-in user snapshots by user ID, the TTL is set from USER_CACHE_TTL in create_app
+user_snapshot_cache = TTLCache()
+
+
+def load_user_snapshot(db_session, user_id):
+    """Return the snapshot of a logged-in user, from the cache when possible.
+    Returns None if the user no longer exists"""
+    snapshot = user_snapshot_cache.get(user_id)
+    if snapshot is None:
+        user = db_session.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = UserSnapshot.from_user(user)
+        user_snapshot_cache.set(user_id, snapshot)
+    return snapshot
+
+
+class UserService(BaseService):
 
     def _validate_username(self, username):
         """Validates the username is a non-empty string, ensures data type is correct"""
@@ -84,10 +101,14 @@ class UserService:
             total_loans=0,
             total_listings=0
         )
-        new_user.set_password(password)
+        try:
+            new_user.set_password(password)
+        except HashingBusy as e:
+            return Result(False, str(e))
 
         try:
-            new_user.save(self.db_session)
+            with self.transaction():
+                new_user.save(self.db_session)
         except Exception as e:
             return Result(False, f"Failed to register user: {str(e)}")
 
@@ -119,13 +140,37 @@ class UserService:
 
         # Verify user existence and password correctness
         existing_user = User.existing_user(self.db_session, username)
-        if existing_user and existing_user.verify_password(password):
+        try:
+            verified = existing_user is not None and existing_user.verify_password(password)
+        except HashingBusy as e:
+            return Result(False, str(e))
+        if verified:
+            self._rehash_password(existing_user, password)
             return Result(True, "Successful login", existing_user)
         else:
             return Result(False, "Invalid username or password")
 
 
 
+    def _rehash_password(self, user, password):
+        """Upgrade the user's stored hash to the current policy after a successful login.
+        A failure is only logged, the login itself still succeeds"""
+        if not user.password_needs_rehash():
+            return
+        try:
+            user.set_password(password)
+            with self.transaction():
+                user.save(self.db_session)
+        except Exception as e:
+            logging.error(f"Failed to rehash password for user ID {user.user_id}: {e}")
+
+    def get_user_by_id(self, user_id):
+        """Retrieves the full user record by ID"""
+        user = User.get_by_id(self.db_session, user_id)
+        if user:
+            return Result(True, "User found", user)
+        return Result(False, "User not found", None)
+
     def update_user(self, user: User, new_username: str, old_password: str, new_password: str, confirm_password: str, marked_for_deletion=None):
         """Update user details - Username, password and mark for delete status """
 
@@ -156,8 +201,11 @@ class UserService:
                 return Result(False, "All fields required to change password")
 
             #Verify old password matches
-            if not user.verify_password(old_password):
-                return Result(False, "Current Password entered incorrectly")
+            try:
+                if not user.verify_password(old_password):
+                    return Result(False, "Current Password entered incorrectly")
+            except HashingBusy as e:
+                return Result(False, str(e))
 
             #Validate password length
             length_error = validate_length(new_password, "New Password", 255)
@@ -184,7 +232,10 @@ class UserService:
                 return Result(False, "New password and confirmation password do not match!")
 
             #Hash the password for the database
-            user.password_hash = generate_password_hash(new_password)
+            try:
+                user.set_password(new_password)
+            except HashingBusy as e:
+                return Result(False, str(e))
             changes_made = True
 
         #Handle the marked_for_deletion toggle logic 
@@ -199,9 +250,11 @@ class UserService:
             changes_made = True
 
         try:
-            user.save(self.db_session)
+            with self.transaction():
+                user.save(self.db_session)
         except Exception as e:
             return Result(False, f"Failed to update user: {str(e)}")
+        user_snapshot_cache.invalidate(user.user_id)
 
         if not changes_made:
             return Result(False, "No changes made")
@@ -0,0 +1,40 @@
+from flask import current_app
+from flask.cli import with_appcontext
+from jinja2 import FileSystemBytecodeCache
+import click
+import os
+
+
+def configure_templates(app):
+    """Keep compiled templates in TEMPLATE_CACHE_DIR (relative to the instance folder) so restarted workers load bytecode instead of
+    compiling the template source again, and optionally compile every template at startup
+    so no request pays for it"""
+
+    cache_dir = app.config.get("TEMPLATE_CACHE_DIR")
+    if cache_dir:
+        #A relative folder is inside the instance folder, wherever the app is started from
+        cache_dir = app.config["TEMPLATE_CACHE_DIR"] = os.path.join(app.instance_path, cache_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    if app.config.get("TEMPLATE_PRECOMPILE"):
+        precompile_templates(app)
+
+
+def precompile_templates(app):
+    """Compile every template, filling the bytecode cache (if configured) and Jinja's in-process cache.
+    Returns the names of the compiled templates"""
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
+
+
+@click.command('precompile-templates')
+@with_appcontext
+def precompile_templates_command():
+    """Compile all templates into the bytecode cache (TEMPLATE_CACHE_DIR), e.g. as a deploy step"""
+    if not current_app.config.get("TEMPLATE_CACHE_DIR"):
+        raise click.ClickException("Set TEMPLATE_CACHE_DIR to the folder compiled templates should be kept in.")
+    names = precompile_templates(current_app)
+    click.echo(f"Compiled {len(names)} templates into {current_app.config['TEMPLATE_CACHE_DIR']}.")
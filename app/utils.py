@@ -1,6 +1,12 @@
 from functools import wraps
-from flask import redirect, url_for, flash
+from flask import redirect, url_for, flash, g, request, render_template, make_response
 from flask_login import current_user
+from app.rate_limit import auth_rate_limiter
+import base64
+import binascii
+import json
+import threading
+import time
 
 
 class Result:
@@ -10,6 +16,109 @@ class Result:
         self.message = message
         self.data = data
 
+class Page:
+    """ Represents one page of keyset-paginated records, with opaque cursors
+    pointing at the neighbouring pages (None when there is no such page) """
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class TTLCache:
+    """ A small process-local cache whose entries expire after ttl seconds.
+    Counts hits and misses so the hit rate can be monitored, a ttl of 0 disables caching.
+    With max_entries set, the least recently used entry is dropped to make room for a new one """
+
+    _MISSING = object()
+
+    def __init__(self, ttl=30, max_entries=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def configure(self, ttl, max_entries=None):
+        """Set a new ttl and size limit and drop every cached entry """
+        with self._lock:
+            self.ttl = ttl
+            self.max_entries = max_entries
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if it is missing or expired """
+        with self._lock:
+            value, expires_at = self._entries.get(key, (self._MISSING, 0))
+            if value is self._MISSING or expires_at <= time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return default
+            self.hits += 1
+            if self.max_entries:
+                #Move the entry to the end, so the front of the dict is the least recently used
+                self._entries[key] = self._entries.pop(key)
+            return value
+
+    def set(self, key, value):
+        """Cache a value for ttl seconds """
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            if self.max_entries and len(self._entries) >= self.max_entries:
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+
+    def invalidate(self, key=None):
+        """Drop one entry, or every entry when no key is given """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        """Return the hit/miss counters and current size """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+            }
+
+
+def encode_cursor(payload: dict) -> str:
+    """Encode a cursor payload as an opaque URL-safe string """
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> dict | None:
+    """Decode a cursor produced by encode_cursor. Returns None if it is malformed """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if not isinstance(payload, dict):
+        return None
+    return payload
+
+
 def flash_result(result: Result):
     """Flash message helper, sets the status of the side-effects to success or danger """
     flash(result.message, "success" if result.success else "danger")
@@ -29,3 +138,44 @@ def admin_required(f):
 
         return f(*args, **kwargs)
     return decorated_function
+
+
+def describe_wait(seconds):
+    """Describe a wait in whole seconds for a message, in minutes once it is two minutes or more """
+    if seconds >= 120:
+        return f"{-(-seconds // 60)} minutes"
+    return f"{seconds} second{'s' if seconds != 1 else ''}"
+
+
+def rate_limited(f):
+    """Decorator for the login and register routes. POSTs over the per-IP or per-username
+    limit get a 429 before the form is handled, so no password is hashed for them """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method == 'POST':
+            username = request.form.get('username', '').strip()
+            retry_after = auth_rate_limiter.check(request.remote_addr, username)
+            if retry_after:
+                flash(f"Too many attempts, please wait {describe_wait(retry_after)} and try again.", "danger")
+                response = make_response(
+                    render_template('login.html', show_register=request.endpoint == 'auth.register'), 429)
+                response.headers['Retry-After'] = str(retry_after)
+                return response
+
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def read_only(f):
+    """Decorator for routes that only read, their queries may be served by a read replica
+    (see RoutingSession). A write during the request moves it back to the primary"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.read_only_route = True
+        g.stick_to_primary = False
+        g.replica_engine = None
+        try:
+            return f(*args, **kwargs)
+        finally:
+            g.read_only_route = False
+    return decorated_function
@@ -0,0 +1,295 @@
+"""Benchmark throughput and latency percentiles of the main routes over HTTP.
+
+For each catalogue size a database is generated with the scale seeder, then every
+scenario below is driven either in-process through the Flask test client or over
+real HTTP against a local gunicorn (--target gunicorn). POSTs that redirect are
+timed including the page they land on, as a browser would see them.
+
+Results are written as JSON so runs on different commits can be compared:
+    python -m benchmarks.http_routes --sizes 1000,100000 --output before.json
+    python -m benchmarks.http_routes --sizes 1000,100000 --output after.json --compare before.json
+
+Generated databases are kept in --data-dir (a temporary folder by default) and reused
+by later runs; each run works on a copy, as reserving books changes the data.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from sqlalchemy import select
+from app import create_app
+from app.extensions import db
+from app.models import User, Listing
+from app.scale_seed import seed_scale, SCALE_PASSWORD
+
+DEFAULT_SIZES = "1000,10000"
+DEFAULT_REQUESTS = 200
+
+# (name, method, path, who is logged in, share of --requests to send)
+SCENARIOS = [
+    ("login", "POST", "/login", None, 0.1),
+    ("dashboard", "GET", "/dashboard", "regular", 1),
+    ("view_listings", "GET", "/view_listings?scope=all", "regular", 1),
+    ("view_listings_search", "GET", "/view_listings?scope=all&search=river", "regular", 1),
+    ("view_loans", "GET", "/view_loans?scope=self", "regular", 1),
+    ("view_loans_all", "GET", "/view_loans?scope=all", "admin", 1),
+    ("view_users", "GET", "/view_users", "admin", 1),
+    ("reserve_book", "POST", "/reserve_book", "regular", 0.5),
+]
+
+
+def dataset(data_dir, listings, seed):
+    """Path of a generated database with `listings` listings, created on first use"""
+    path = Path(data_dir) / f"scale-{listings}-{seed}.db"
+    if not path.exists():
+        app = create_app(testing=True, config={"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}"})
+        with app.app_context():
+            seed_scale(db.engine, users=max(10, listings // 10), listings=listings, loans=listings, seed=seed)
+            db.session.remove()
+            db.engine.dispose()
+    return path
+
+
+def pick_accounts(database_url, reservations):
+    """Usernames for the regular and admin scenarios, and listings the regular user can reserve"""
+    app = create_app(testing=True, config={"SQLALCHEMY_DATABASE_URI": database_url})
+    with app.app_context():
+        regular = db.session.scalars(select(User).where(User.role == 'regular', User.total_loans > 0)
+                                     .order_by(User.user_id)).first()
+        admin = db.session.scalars(select(User).where(User.role == 'admin').order_by(User.user_id)).first()
+        available = db.session.scalars(
+            select(Listing.listing_id)
+            .where(Listing.is_available.is_(True), Listing.user_id != regular.user_id)
+            .order_by(Listing.listing_id).limit(reservations)
+        ).all()
+        db.session.remove()
+        db.engine.dispose()
+    return {"regular": regular.username, "admin": (admin or regular).username}, available
+
+
+class TestClientTarget:
+    """Sends requests in-process through the Flask test client"""
+
+    concurrency = 1
+
+    def __init__(self, database_url):
+        self.app = create_app(testing=True, config={
+            "SQLALCHEMY_DATABASE_URI": database_url,
+            "RATE_LIMIT_ENABLED": False,
+        })
+
+    def client(self, username=None):
+        client = self.app.test_client()
+        if username:
+            self.send(client, "POST", "/login", {"username": username, "password": SCALE_PASSWORD})
+        return client
+
+    def send(self, client, method, path, data=None):
+        response = client.open(path, method=method, data=data, follow_redirects=True)
+        return response.status_code
+
+    def close(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+
+
+class GunicornTarget:
+    """Starts gunicorn on the database and sends real HTTP requests from a pool of threads"""
+
+    def __init__(self, database_url, workers, concurrency):
+        self.concurrency = concurrency
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        env = dict(os.environ, DATABASE_URL=database_url, RATE_LIMIT_ENABLED="false")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}", "app:create_app()"],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self._wait_until_ready()
+
+    def _wait_until_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("gunicorn exited, is it installed? (pip install -r requirements.txt)")
+            try:
+                urllib.request.urlopen(self.base_url + "/login", timeout=1)
+                return
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.2)
+        self.close()
+        raise RuntimeError("gunicorn did not start in time")
+
+    def client(self, username=None):
+        client = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        if username:
+            self.send(client, "POST", "/login", {"username": username, "password": SCALE_PASSWORD})
+        return client
+
+    def send(self, client, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with client.open(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait(timeout=30)
+
+
+def measure(target, method, path, username, payloads):
+    """Send one request per payload, split across the target's concurrency, and summarise them"""
+    chunks = [payloads[worker::target.concurrency] for worker in range(target.concurrency)]
+    chunks = [chunk for chunk in chunks if chunk]
+    # Clients log in before the clock starts
+    clients = [target.client(username) for _ in chunks]
+
+    def run_chunk(client, chunk):
+        timings, errors = [], 0
+        for data in chunk:
+            start = time.perf_counter()
+            status = target.send(client, method, path, data)
+            timings.append((time.perf_counter() - start) * 1000)
+            errors += status >= 400
+        return timings, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=target.concurrency) as pool:
+        results = list(pool.map(run_chunk, clients, chunks))
+    elapsed = time.perf_counter() - started
+
+    timings = sorted(timing for chunk_timings, _ in results for timing in chunk_timings)
+    cut_points = statistics.quantiles(timings, n=100, method='inclusive') if len(timings) > 1 else timings * 99
+    return {
+        "requests": len(timings),
+        "errors": sum(errors for _, errors in results),
+        "throughput_rps": round(len(timings) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(timings), 2),
+        "p50_ms": round(cut_points[49], 2),
+        "p95_ms": round(cut_points[94], 2),
+        "p99_ms": round(cut_points[98], 2),
+    }
+
+
+def run_size(args, listings):
+    """Run every scenario against a fresh copy of the generated database of this size"""
+    template = dataset(args.data_dir, listings, args.seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / template.name
+        shutil.copyfile(template, path)
+        database_url = f"sqlite:///{path}"
+        reservations = max(1, int(args.requests * 0.5))
+        accounts, available = pick_accounts(database_url, reservations + args.warmup)
+
+        if args.target == "gunicorn":
+            target = GunicornTarget(database_url, args.workers, args.concurrency)
+        else:
+            target = TestClientTarget(database_url)
+        try:
+            for name, method, path_, role, share in SCENARIOS:
+                if args.only and name not in args.only:
+                    continue
+                count = max(1, int(args.requests * share))
+                if name == "login":
+                    payloads = [{"username": accounts["regular"], "password": SCALE_PASSWORD}] * (count + args.warmup)
+                elif name == "reserve_book":
+                    payloads = [{"reserve": "on", "listing_id": listing_id} for listing_id in available]
+                else:
+                    payloads = [None] * (count + args.warmup)
+
+                username = accounts[role] if role else None
+                if args.warmup:
+                    measure(target, method, path_, username, payloads[:args.warmup])
+                results[name] = measure(target, method, path_, username, payloads[args.warmup:])
+                print(f"{listings:>9} {name:>22} {results[name]['throughput_rps']:>9.1f} "
+                      f"{results[name]['p50_ms']:>8.2f} {results[name]['p95_ms']:>8.2f} "
+                      f"{results[name]['p99_ms']:>8.2f} {results[name]['errors']:>6}", file=sys.stderr)
+        finally:
+            target.close()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print the change in throughput and p95 latency against an earlier results file"""
+    print(f"\nChange against {baseline['commit'] or 'baseline'}:", file=sys.stderr)
+    print(f"{'listings':>9} {'scenario':>22} {'req/s':>9} {'p95':>9}", file=sys.stderr)
+    for size, scenarios in results["sizes"].items():
+        for name, after in scenarios.items():
+            before = baseline["sizes"].get(size, {}).get(name)
+            if not before:
+                continue
+            throughput = (after["throughput_rps"] / before["throughput_rps"] - 1) * 100
+            p95 = (after["p95_ms"] / before["p95_ms"] - 1) * 100
+            print(f"{size:>9} {name:>22} {throughput:>+8.1f}% {p95:>+8.1f}%", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated listing counts to test.")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="Requests per scenario.")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed requests before each scenario.")
+    parser.add_argument("--target", choices=("test-client", "gunicorn"), default="test-client")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Client threads against gunicorn.")
+    parser.add_argument("--only", nargs="*", help="Only run these scenarios.")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the generated data.")
+    parser.add_argument("--data-dir", help="Folder to keep generated databases in between runs.")
+    parser.add_argument("--output", help="Write the results to this JSON file (default: stdout).")
+    parser.add_argument("--compare", help="Earlier results file to compare against.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        args.data_dir = args.data_dir or scratch
+        Path(args.data_dir).mkdir(parents=True, exist_ok=True)
+        print(f"{'listings':>9} {'scenario':>22} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'errors':>6}", file=sys.stderr)
+        results = {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "target": args.target,
+            "python": platform.python_version(),
+            "requests": args.requests,
+            "concurrency": args.concurrency if args.target == "gunicorn" else 1,
+            "sizes": {size: run_size(args, int(size)) for size in args.sizes.split(",")},
+        }
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(report + "\n")
+    else:
+        print(report)
+    if args.compare:
+        compare(results, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Benchmark logins per second on one core for each password hash policy.
+
+Each policy logs the same user in through UserService.user_login (username lookup
+plus hash verification) on a single thread, so the rate is per core.
+
+Run from the project root:
+    python -m benchmarks.password_hashing [logins per policy] [policies...]
+"""
+import sys
+import time
+from app import create_app
+from app.extensions import db
+from app.models import User
+from app.passwords import DEFAULT_HASH_METHOD
+from app.services.user_service import UserService
+
+DEFAULT_LOGINS = 20
+DEFAULT_POLICIES = (
+    DEFAULT_HASH_METHOD,
+    'scrypt:16384:8:1',
+    'pbkdf2:sha256:1000000',
+    'pbkdf2:sha256:600000',
+    'pbkdf2:sha256:100000',
+)
+
+
+def logins_per_second(policy, logins):
+    app = create_app(testing=True, config={"PASSWORD_HASH_METHOD": policy})
+    with app.app_context():
+        db.create_all()
+        user = User(username="member", role="regular")
+        user.set_password("memberpass")
+        db.session.add(user)
+        db.session.commit()
+        service = UserService(db.session)
+        service.user_login("member", "memberpass")
+
+        start = time.perf_counter()
+        for _ in range(logins):
+            assert service.user_login("member", "memberpass").success
+        elapsed = time.perf_counter() - start
+        db.drop_all()
+    return logins / elapsed
+
+
+def main(logins, policies):
+    print(f"{'policy':>24} {'logins/s/core':>14} {'ms/login':>9}")
+    for policy in policies:
+        rate = logins_per_second(policy, logins)
+        print(f"{policy:>24} {rate:>14.1f} {1000 / rate:>9.1f}")
+
+
+if __name__ == '__main__':
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LOGINS
+    main(logins, sys.argv[2:] or DEFAULT_POLICIES)
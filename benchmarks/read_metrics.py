@@ -0,0 +1,81 @@
+"""Benchmark DashboardService.read_metrics against the separate COUNT queries it replaced.
+
+Run from the project root:
+    python -m benchmarks.read_metrics [table sizes...]
+"""
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from app import create_app
+from app.extensions import db
+from app.models import User, Listing, Loan
+from app.services.dashboard_service import DashboardService
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+REPEATS = 50
+
+
+def populate(size):
+    """Insert `size` listings and loans spread over 100 users"""
+    db.session.execute(User.__table__.insert(), [
+        {"user_id": i, "username": f"user{i}", "username_normalized": f"user{i}",
+         "password_hash": "x", "role": "regular",
+         "total_loans": 0, "total_listings": 0, "join_date": date(2024, 1, 1)}
+        for i in range(1, 101)
+    ])
+    db.session.execute(Listing.__table__.insert(), [
+        {"listing_id": i, "title": f"Book {i}", "user_id": i % 100 + 1, "is_available": i % 3 != 0,
+         "marked_for_deletion": False, "date_listed": date(2024, 1, 1) + timedelta(days=i % 365)}
+        for i in range(1, size + 1)
+    ])
+    db.session.execute(Loan.__table__.insert(), [
+        {"loan_id": i, "listing_id": i, "user_id": (i + 7) % 100 + 1, "is_returned": i % 4 != 0,
+         "start_date": date(2024, 1, 1), "return_date": date(2024, 1, 22)}
+        for i in range(1, size + 1)
+    ])
+    db.session.commit()
+
+
+def separate_counts(user):
+    """The five COUNT queries read_metrics used to issue for a logged-in user"""
+    return {
+        "user_active_listings": Listing.count_by_user(db.session, user.user_id),
+        "user_active_loans": Loan.count_active_by_user(db.session, user.user_id),
+        "active_loans": Loan.count_active(db.session),
+        "listed_books": Listing.count_all(db.session),
+        "available_books": Listing.count_available(db.session),
+    }
+
+
+def median_ms(func):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def run(size):
+    app = create_app(testing=True)
+    with app.app_context():
+        db.create_all()
+        populate(size)
+        user = db.session.get(User, 1)
+        service = DashboardService(db.session)
+        separate = median_ms(lambda: separate_counts(user))
+        aggregate = median_ms(lambda: service.read_metrics(user))
+        db.drop_all()
+    return separate, aggregate
+
+
+def main(sizes):
+    print(f"{'rows':>10} {'5 x COUNT (ms)':>16} {'aggregate (ms)':>16}")
+    for size in sizes:
+        separate, aggregate = run(size)
+        print(f"{size:>10} {separate:>16.2f} {aggregate:>16.2f}")
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,97 @@
+"""Benchmark concurrent reads and writes with the SQLite pragma profile against the old defaults.
+
+"default" only enables foreign keys (rollback journal, FULL sync), as before the
+pragma profile existed. Reader threads load listing pages while writer threads
+list new books, each thread on its own connection to a file database.
+
+Run from the project root:
+    python -m benchmarks.sqlite_pragmas [seconds] [readers] [writers]
+"""
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from app import create_app
+from app.database import DEFAULT_SQLITE_PRAGMAS
+from app.extensions import db
+from app.models import User, Listing
+from app.services.dashboard_service import DashboardService
+from app.services.listing_service import ListingService
+
+PROFILES = {
+    "default": {"foreign_keys": "ON"},
+    "tuned": DEFAULT_SQLITE_PRAGMAS,
+}
+
+
+def run(pragmas, seconds, readers, writers):
+    """Return (reads/s, writes/s, failed operations) for one pragma profile"""
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app(testing=True, config={
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{Path(directory) / 'bench.db'}",
+            "SQLITE_PRAGMAS": pragmas,
+        })
+        with app.app_context():
+            owner = User(username="owner", password_hash="x", role="regular",
+                         total_loans=0, total_listings=0, join_date=date(2024, 1, 1))
+            db.session.add(owner)
+            db.session.commit()
+            owner_id = owner.user_id
+
+        counts = {"reads": 0, "writes": 0, "failed": 0}
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def count(name):
+            with lock:
+                counts[name] += 1
+
+        def reader():
+            with app.app_context():
+                while not stop.is_set():
+                    try:
+                        Listing.filter_search_listings(db.session, render_profile='card', page_size=20)
+                        db.session.rollback()
+                        count("reads")
+                    except Exception:
+                        db.session.rollback()
+                        count("failed")
+                db.session.remove()
+
+        def writer(number):
+            with app.app_context():
+                service = ListingService(db.session, DashboardService(db.session))
+                while not stop.is_set():
+                    result = service.list_book(f"Book {number}", "Author", "Desc", None, owner_id)
+                    count("writes" if result.success else "failed")
+                db.session.remove()
+
+        threads = ([threading.Thread(target=reader) for _ in range(readers)]
+                   + [threading.Thread(target=writer, args=(n,)) for n in range(writers)])
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        with app.app_context():
+            db.engine.dispose()
+    return counts["reads"] / seconds, counts["writes"] / seconds, counts["failed"]
+
+
+def main(seconds, readers, writers):
+    print(f"{readers} readers, {writers} writers, {seconds}s per profile")
+    print(f"{'profile':>8} {'reads/s':>10} {'writes/s':>10} {'failed':>8}")
+    for name, pragmas in PROFILES.items():
+        reads, writes, failed = run(pragmas, seconds, readers, writers)
+        print(f"{name:>8} {reads:>10.0f} {writes:>10.0f} {failed:>8}")
+
+
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    writers = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    main(seconds, readers, writers)
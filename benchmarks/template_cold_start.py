@@ -0,0 +1,79 @@
+"""Benchmark template compile cost on a cold start, with and without the bytecode cache.
+
+Each mode runs in a fresh Python process, as a newly started worker would:
+"no cache" compiles every template from source on its first render, "bytecode"
+loads them from a TEMPLATE_CACHE_DIR filled by `flask precompile-templates`, and
+"precompiled" also compiles them at startup (TEMPLATE_PRECOMPILE) so the first
+request finds them ready. Reported are the startup time added by the templates,
+the time to get every template once, and the first request to the listings page.
+
+Run from the project root:
+    python -m benchmarks.template_cold_start [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+DEFAULT_RUNS = 5
+
+# Runs in the child process: prints startup, all-template and first-request times in ms
+_CHILD = r"""
+import json, time
+from app import create_app
+from app.extensions import db
+from app.models import User
+
+started = time.perf_counter()
+app = create_app(testing=True)
+startup = (time.perf_counter() - started) * 1000
+
+with app.app_context():
+    user = User(username="member", role="regular", password_hash="x")
+    db.session.add(user)
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(user.user_id)
+
+    started = time.perf_counter()
+    client.get("/view_listings?scope=all")
+    first_request = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    for name in app.jinja_env.list_templates(extensions=["html"]):
+        app.jinja_env.get_template(name)
+    all_templates = (time.perf_counter() - started) * 1000
+
+print(json.dumps([startup, all_templates, first_request]))
+"""
+
+
+def cold_start(env):
+    output = subprocess.run([sys.executable, "-c", _CHILD], env=env, capture_output=True,
+                            text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main(runs):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        base = {key: value for key, value in os.environ.items() if not key.startswith("TEMPLATE_")}
+        subprocess.run([sys.executable, "-m", "flask", "--app", "app:create_app(testing=True)",
+                        "precompile-templates"], env=dict(base, TEMPLATE_CACHE_DIR=cache_dir),
+                       check=True, capture_output=True)
+        modes = {
+            "no cache": base,
+            "bytecode": dict(base, TEMPLATE_CACHE_DIR=cache_dir),
+            "precompiled": dict(base, TEMPLATE_CACHE_DIR=cache_dir, TEMPLATE_PRECOMPILE="true"),
+        }
+        print(f"{'mode':>12} {'startup ms':>11} {'templates ms':>13} {'first request ms':>17}")
+        for mode, env in modes.items():
+            samples = [cold_start(env) for _ in range(runs)]
+            startup, templates, first = (statistics.median(column) for column in zip(*samples))
+            print(f"{mode:>12} {startup:>11.1f} {templates:>13.1f} {first:>17.1f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RUNS)
@@ -0,0 +1,95 @@
+"""Benchmark commits per operation and latency with and without the service unit of work.
+
+"per-save" replays the old behaviour, where every save() committed on its own,
+by turning BaseService.transaction into a no-op. Runs against a file database
+so each commit pays for the journal sync, as it does in production.
+
+Run from the project root:
+    python -m benchmarks.unit_of_work [operations]
+"""
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from unittest.mock import patch
+from sqlalchemy import event
+from app import create_app
+from app.extensions import db
+from app.models import User
+from app.services.base import BaseService
+from app.services.dashboard_service import DashboardService
+from app.services.listing_service import ListingService
+
+DEFAULT_OPERATIONS = 200
+
+
+@contextmanager
+def per_save_commits(self):
+    yield
+
+
+def add_user(username):
+    user = User(username=username, password_hash="x", role="regular",
+                total_loans=0, total_listings=0, join_date=date(2024, 1, 1))
+    db.session.add(user)
+    db.session.commit()
+    return user.user_id
+
+
+def run(operations, unit_of_work):
+    """Return {operation: (commits per call, median ms)} for list, reserve and return"""
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app(testing=True, config={
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{Path(directory) / 'bench.db'}"})
+        with app.app_context():
+            owner_id = add_user("owner")
+            borrower_id = add_user("borrower")
+            service = ListingService(db.session, DashboardService(db.session))
+
+            commits = []
+            event.listen(db.session(), 'after_commit', lambda session: commits.append(1))
+
+            def measure(calls):
+                commits.clear()
+                timings, results = [], []
+                for call in calls:
+                    start = time.perf_counter()
+                    results.append(call())
+                    timings.append((time.perf_counter() - start) * 1000)
+                return results, (len(commits) / len(calls), statistics.median(timings))
+
+            transaction = BaseService.transaction if unit_of_work else per_save_commits
+            with patch.object(BaseService, 'transaction', transaction):
+                listings, listed = measure([
+                    lambda i=i: service.list_book(f"Book {i}", "Author", "Desc", None, owner_id)
+                    for i in range(operations)])
+                listing_ids = [result.data.listing_id for result in listings]
+
+                loans, reserved = measure([
+                    lambda listing_id=listing_id: service.reserve_book(borrower_id, listing_id)
+                    for listing_id in listing_ids])
+                loan_ids = [result.data.loan_id for result in loans]
+
+                _, returned = measure([
+                    lambda loan_id=loan_id: service.update_loan(loan_id, date.today())
+                    for loan_id in loan_ids])
+
+            db.session.remove()
+            db.engine.dispose()
+    return {"list_book": listed, "reserve_book": reserved, "update_loan": returned}
+
+
+def main(operations):
+    before = run(operations, unit_of_work=False)
+    after = run(operations, unit_of_work=True)
+    print(f"{'operation':>14} {'commits before':>15} {'commits after':>14} {'ms before':>10} {'ms after':>9}")
+    for name in before:
+        print(f"{name:>14} {before[name][0]:>15.1f} {after[name][0]:>14.1f} "
+              f"{before[name][1]:>10.2f} {after[name][1]:>9.2f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_OPERATIONS)
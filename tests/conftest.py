@@ -1,6 +1,12 @@
 import pytest
+from collections import Counter
+from datetime import date
+from flask import g
+from sqlalchemy import event
 from app import create_app
 from app.extensions import db as _db
+from app.models import User, Listing, Genre
+from app.search import drop_listing_fts
 
 
 @pytest.fixture
@@ -10,9 +16,74 @@ def app():
     with app.app_context():
         _db.create_all()
         yield app
+        _db.session.remove()
         _db.drop_all()
+        #Only matters when TEST_DATABASE_URL points at a database that outlives the test
+        drop_listing_fts(_db.engine)
 
 
 @pytest.fixture
 def client(app):
     return app.test_client()
+
+
+@pytest.fixture
+def query_counter(app):
+    """Records every SQL statement sent to the test database"""
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(_db.engine, 'before_cursor_execute', record_statement)
+    yield statements
+    event.remove(_db.engine, 'before_cursor_execute', record_statement)
+
+
+@pytest.fixture
+def instance_loads(app):
+    """Counts the model instances loaded from query rows, by model name"""
+    loads = Counter()
+
+    def record_load(target, context):
+        loads[type(target).__name__] += 1
+
+    event.listen(_db.Model, 'load', record_load, propagate=True)
+    yield loads
+    event.remove(_db.Model, 'load', record_load)
+
+
+@pytest.fixture
+def member(app):
+    """A regular user with the password "password" """
+    user = User(username="member", role="regular", total_loans=0, total_listings=0)
+    user.set_password("password")
+    _db.session.add(user)
+    _db.session.commit()
+    yield user
+
+
+@pytest.fixture
+def library(app):
+    """One listing with its owner, plus another member and an admin to view it. Returns their IDs"""
+    genre = Genre(name='Fantasy', image='images/fantasy.png')
+    owner = User(username='owner', role='regular', password_hash='x')
+    reader = User(username='reader', role='regular', password_hash='x')
+    admin = User(username='boss', role='admin', password_hash='x')
+    listing = Listing(title='Dune', author='Herbert', description='Desc', genre=genre, user=owner,
+                      date_listed=date(2025, 1, 1))
+    _db.session.add_all([genre, owner, reader, admin, listing])
+    _db.session.commit()
+    return {"owner": owner.user_id, "reader": reader.user_id, "admin": admin.user_id,
+            "listing": listing.listing_id}
+
+
+@pytest.fixture
+def log_in(client):
+    """Returns a function that makes the test client's next requests as the given user"""
+    def log_in_as(user_id):
+        #The test client shares the fixture's app context, so forget the previous request's user
+        g.pop('_login_user', None)
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+    return log_in_as
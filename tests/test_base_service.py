@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy import event
+from app.services.base import BaseService
+from app.services.dashboard_service import DashboardService
+from app.services.listing_service import ListingService
+from app.models import User, Genre, Listing
+from app.extensions import db as _db
+
+
+@pytest.fixture
+def commits(app):
+    """Records every commit made on the test session"""
+    recorded = []
+    session = _db.session()
+
+    def record_commit(session):
+        recorded.append(session)
+
+    event.listen(session, 'after_commit', record_commit)
+    yield recorded
+    event.remove(session, 'after_commit', record_commit)
+
+
+def test_transaction_commits_staged_saves_once(app, commits):
+    service = BaseService(_db.session)
+
+    with service.transaction():
+        Genre(name="Fantasy", image="images/fantasy.png").save(_db.session)
+        Genre(name="Horror", image="images/horror.png").save(_db.session)
+        assert commits == []
+
+    assert len(commits) == 1
+    assert Genre.query.count() == 2
+
+
+def test_transaction_rolls_back_on_error(app, commits):
+    service = BaseService(_db.session)
+
+    with pytest.raises(RuntimeError):
+        with service.transaction():
+            Genre(name="Fantasy", image="images/fantasy.png").save(_db.session)
+            raise RuntimeError("failed half way")
+
+    assert commits == []
+    assert Genre.query.count() == 0
+    #Saves outside a transaction commit straight away again
+    Genre(name="Horror", image="images/horror.png").save(_db.session)
+    assert len(commits) == 1
+
+
+def test_nested_transaction_joins_outer(app, commits):
+    service = BaseService(_db.session)
+
+    with service.transaction():
+        with service.transaction():
+            Genre(name="Fantasy", image="images/fantasy.png").save(_db.session)
+        assert commits == []
+
+    assert len(commits) == 1
+
+
+def test_listing_operations_commit_once(app, member, commits):
+    listing_service = ListingService(_db.session, DashboardService(_db.session))
+    borrower = User(username="borrower", role="regular", total_loans=0, total_listings=0)
+    borrower.set_password("password")
+    _db.session.add(borrower)
+    _db.session.commit()
+    commits.clear()
+
+    listing = listing_service.list_book("Dune", "Herbert", "Desc", None, member.user_id).data
+    assert len(commits) == 1
+
+    loan = listing_service.reserve_book(borrower.user_id, listing.listing_id).data
+    assert len(commits) == 2
+
+    listing_service.update_loan(loan.loan_id, actual_return_date=loan.return_date)
+    assert len(commits) == 3
+    assert _db.session.get(Listing, listing.listing_id).is_available is True
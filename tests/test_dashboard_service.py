@@ -0,0 +1,168 @@
+import pytest
+import json
+from unittest.mock import MagicMock
+from app.services.dashboard_service import DashboardService, site_metrics_cache
+from app.services.listing_service import ListingService
+from app.models import User, Listing, Loan, SiteCounter
+from app.extensions import db as _db
+from datetime import date
+
+
+@pytest.fixture
+def dashboard_service(app):
+    return DashboardService(_db.session)
+
+
+def test_counters_start_at_zero(dashboard_service):
+    result = dashboard_service.read_metrics()
+
+    assert result.success is True
+    assert result.data["total_overall_books"] == 0
+    assert result.data["total_overall_loans"] == 0
+
+
+def test_import_metrics_file_runs_once(app, tmp_path):
+    metrics_file = tmp_path / "metrics.json"
+    metrics_file.write_text(json.dumps({"total_overall_books": 289, "total_overall_loans": 234}))
+    _db.session.query(SiteCounter).delete()
+    _db.session.commit()
+
+    service = DashboardService(_db.session)
+    assert service.import_metrics_file(str(metrics_file)).success is True
+
+    metrics_file.write_text(json.dumps({"total_overall_books": 1, "total_overall_loans": 1}))
+    service.import_metrics_file(str(metrics_file))
+
+    data = service.read_metrics().data
+    assert (data["total_overall_books"], data["total_overall_loans"]) == (289, 234)
+
+
+def test_increment_is_staged_until_commit(dashboard_service):
+    dashboard_service.update_overall_loans()
+    _db.session.rollback()
+    assert dashboard_service.read_metrics().data["total_overall_loans"] == 0
+
+    dashboard_service.update_overall_loans()
+    _db.session.commit()
+    assert dashboard_service.read_metrics().data["total_overall_loans"] == 1
+
+
+def test_list_book_counts_listing_in_same_commit(dashboard_service, member):
+    listing_service = ListingService(_db.session, dashboard_service)
+
+    result = listing_service.list_book("Counted", "Author", "Desc", None, member.user_id)
+
+    assert result.success is True
+    _db.session.expire_all()
+    assert SiteCounter.get_values(_db.session, ["total_overall_books"]) == {"total_overall_books": 1}
+
+
+def test_reserve_book_counts_loan(dashboard_service, member):
+    borrower = User(username="borrower", role="regular", total_loans=0)
+    borrower.set_password("password")
+    listing = Listing(title="Loaned", user_id=member.user_id, date_listed=date.today())
+    _db.session.add_all([borrower, listing])
+    _db.session.commit()
+
+    result = ListingService(_db.session, dashboard_service).reserve_book(borrower.user_id, listing.listing_id)
+
+    assert result.success is True
+    assert dashboard_service.read_metrics().data["total_overall_loans"] == 1
+
+
+def test_read_metrics_does_not_touch_filesystem(monkeypatch, dashboard_service, member):
+    monkeypatch.setattr("builtins.open", MagicMock(side_effect=AssertionError("file opened")))
+
+    result = dashboard_service.read_metrics(member)
+
+    assert result.success is True
+    assert result.data["user_active_listings"] == 0
+
+
+def test_read_metrics_for_user_is_one_query(dashboard_service, member, query_counter):
+    other = User(username="other", role="regular", total_loans=0)
+    other.set_password("password")
+    _db.session.add(other)
+    _db.session.flush()
+    listings = [
+        Listing(title=f"Book {i}", user_id=member.user_id if i % 2 else other.user_id,
+                is_available=i % 3 != 0, date_listed=date.today())
+        for i in range(6)
+    ]
+    _db.session.add_all(listings)
+    _db.session.flush()
+    _db.session.add_all([
+        Loan(listing_id=listings[0].listing_id, user_id=member.user_id, is_returned=False),
+        Loan(listing_id=listings[3].listing_id, user_id=other.user_id, is_returned=False),
+        Loan(listing_id=listings[2].listing_id, user_id=member.user_id, is_returned=True),
+    ])
+    SiteCounter.increment(_db.session, 'total_overall_books', 6)
+    _db.session.commit()
+    _db.session.refresh(member)
+    query_counter.clear()
+
+    data = dashboard_service.read_metrics(member).data
+
+    assert len(query_counter) == 1
+    assert data["user_active_listings"] == Listing.count_by_user(_db.session, member.user_id) == 3
+    assert data["user_active_loans"] == Loan.count_active_by_user(_db.session, member.user_id) == 1
+    assert data["active_loans"] == Loan.count_active(_db.session) == 2
+    assert data["listed_books"] == Listing.count_all(_db.session) == 6
+    assert data["available_books"] == Listing.count_available(_db.session) == 4
+    assert data["total_overall_books"] == 6
+    assert data["total_overall_loans"] == 0
+
+
+def test_site_metrics_are_cached_until_a_change_commits(dashboard_service, member, query_counter):
+    site_metrics_cache.configure(ttl=60)
+    assert dashboard_service.read_metrics().data["listed_books"] == 0
+    query_counter.clear()
+
+    assert dashboard_service.read_metrics().data["listed_books"] == 0
+    assert query_counter == []
+
+    _db.session.add(Listing(title="New", user_id=member.user_id, date_listed=date.today()))
+    _db.session.commit()
+
+    assert dashboard_service.read_metrics().data["listed_books"] == 1
+    assert site_metrics_cache.stats()["hits"] == 1
+    assert site_metrics_cache.stats()["misses"] == 2
+
+
+def test_deleting_a_user_invalidates_their_cascaded_listings(dashboard_service, member):
+    site_metrics_cache.configure(ttl=60)
+    borrower = User(username="borrower", role="regular", total_loans=0, password_hash="x")
+    listing = Listing(title="Owned", user_id=member.user_id, date_listed=date.today(), is_available=False)
+    _db.session.add_all([borrower, listing])
+    _db.session.commit()
+    _db.session.add(Loan(listing_id=listing.listing_id, user_id=borrower.user_id, start_date=date.today(),
+                         return_date=date.today(), is_returned=False))
+    _db.session.commit()
+    data = dashboard_service.read_metrics().data
+    assert (data["listed_books"], data["active_loans"]) == (1, 1)
+
+    #The listings and loans are removed by ON DELETE CASCADE, without the session loading them
+    member_id = member.user_id
+    _db.session.expunge_all()
+    _db.session.delete(_db.session.get(User, member_id))
+    _db.session.commit()
+
+    data = dashboard_service.read_metrics().data
+    assert (data["listed_books"], data["active_loans"]) == (0, 0)
+
+
+def test_cache_disabled_with_zero_ttl(dashboard_service, query_counter):
+    site_metrics_cache.configure(ttl=0)
+    dashboard_service.read_metrics()
+    dashboard_service.read_metrics()
+
+    assert len(query_counter) == 2
+
+
+def test_anonymous_login_page_runs_no_queries(client, query_counter):
+    client.get('/login')
+    query_counter.clear()
+
+    assert client.get('/login').status_code == 200
+    assert client.get('/register').status_code == 200
+    assert query_counter == []
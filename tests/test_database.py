@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+from sqlalchemy import text
+from app import create_app
+from app.database import (configure_sqlite, sqlite_pragmas_from_env, DEFAULT_SQLITE_PRAGMAS,
+                          database_url, engine_options_from_env)
+from app.extensions import db as _db
+
+
+def test_sqlite_connections_get_the_pragma_profile(tmp_path):
+    app = create_app(testing=True, config={"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'app.db'}"})
+
+    with app.app_context():
+        with _db.engine.connect() as connection:
+            assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert connection.execute(text("PRAGMA foreign_keys")).scalar() == 1
+            assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+            assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+            assert connection.execute(text("PRAGMA temp_store")).scalar() == 2  # MEMORY
+        _db.engine.dispose()
+
+
+def test_pragmas_can_be_overridden_from_env(monkeypatch):
+    monkeypatch.setenv("SQLITE_BUSY_TIMEOUT", "250")
+
+    pragmas = sqlite_pragmas_from_env()
+
+    assert pragmas["busy_timeout"] == "250"
+    assert pragmas["journal_mode"] == DEFAULT_SQLITE_PRAGMAS["journal_mode"]
+
+
+def test_pragma_hook_is_sqlite_only():
+    engine = SimpleNamespace(dialect=SimpleNamespace(name="mysql"))
+    assert configure_sqlite(engine, DEFAULT_SQLITE_PRAGMAS) is False
+
+
+def test_database_url_uses_pymysql_for_mysql():
+    assert database_url("mysql://bookshare:pw@db/bookshare") == "mysql+pymysql://bookshare:pw@db/bookshare"
+    assert database_url("sqlite:///bookshare.db") == "sqlite:///bookshare.db"
+
+
+def test_engine_options_come_from_env(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "3")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "false")
+
+    options = engine_options_from_env("mysql+pymysql://bookshare@db/bookshare")
+
+    assert options["pool_size"] == 3
+    assert options["pool_pre_ping"] is False
+    assert options["max_overflow"] == 20
+    #The single shared in-memory SQLite connection cannot be pooled
+    assert engine_options_from_env("sqlite:///:memory:") == {}
+
+
+def test_create_app_reads_database_url(monkeypatch, tmp_path):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'configured.db'}")
+    monkeypatch.setenv("DB_POOL_SIZE", "2")
+
+    app = create_app()
+
+    assert app.config["SQLALCHEMY_DATABASE_URI"].endswith("configured.db")
+    with app.app_context():
+        assert _db.engine.pool.size() == 2
+        _db.engine.dispose()
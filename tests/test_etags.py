@@ -0,0 +1,93 @@
+import pytest
+from app.extensions import db as _db
+from app.etags import CHANGE_COUNTERS
+from app.models import User, Listing, SiteCounter
+
+PAGES = ['/view_listings?scope=all', '/view_loans?scope=all', '/view_users']
+
+
+def counters():
+    _db.session.expire_all()
+    return SiteCounter.get_values(_db.session, list(CHANGE_COUNTERS.values()))
+
+
+@pytest.mark.parametrize('path', PAGES)
+def test_unchanged_page_is_answered_with_304(client, log_in, library, query_counter, path):
+    log_in(library["admin"])
+    response = client.get(path)
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert etag.startswith('W/')
+
+    _db.session.expunge_all()
+    query_counter.clear()
+    response = client.get(path, headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    #Only the change counters are read, not the page's records
+    assert not [statement for statement in query_counter
+                if 'FROM listing' in statement or 'FROM loan' in statement]
+
+
+def test_etag_changes_with_the_data(client, log_in, library):
+    log_in(library["admin"])
+    etag = client.get('/view_listings?scope=all').headers['ETag']
+
+    listing = _db.session.get(Listing, library["listing"])
+    listing.title = 'Dune Messiah'
+    _db.session.commit()
+
+    response = client.get('/view_listings?scope=all', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'Dune Messiah' in response.data
+    assert response.headers['ETag'] != etag
+
+
+def test_etag_depends_on_query_and_viewer(client, log_in, library):
+    log_in(library["admin"])
+    etag = client.get('/view_listings?scope=all').headers['ETag']
+    assert client.get('/view_listings?scope=self').headers['ETag'] != etag
+
+    log_in(library["owner"])
+    response = client.get('/view_listings?scope=all', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+
+def test_page_with_pending_flash_is_rendered(client, log_in, library):
+    log_in(library["admin"])
+    etag = client.get('/view_listings?scope=all').headers['ETag']
+    with client.session_transaction() as sess:
+        sess['_flashes'] = [('success', 'Listing updated')]
+
+    response = client.get('/view_listings?scope=all', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'Listing updated' in response.data
+
+
+def test_conditional_get_can_be_disabled(app, client, log_in, library):
+    app.config['CONDITIONAL_GET_ENABLED'] = False
+    log_in(library["admin"])
+    assert 'ETag' not in client.get('/view_listings?scope=all').headers
+
+
+def test_bulk_claim_counts_as_a_listing_change(library):
+    before = counters()
+    assert Listing.claim_for_loan(_db.session, library["listing"])
+    _db.session.commit()
+
+    after = counters()
+    assert after['listing_changes'] == before['listing_changes'] + 1
+    assert after['loan_changes'] == before['loan_changes']
+
+
+def test_deleting_a_user_counts_their_cascaded_rows(library):
+    before = counters()
+    _db.session.delete(_db.session.get(User, library["owner"]))
+    _db.session.commit()
+
+    after = counters()
+    for name in ('user_changes', 'listing_changes', 'loan_changes'):
+        assert after[name] == before[name] + 1
+    assert after['genre_changes'] == before['genre_changes']
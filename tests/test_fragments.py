@@ -0,0 +1,102 @@
+import pytest
+from datetime import date, timedelta
+from app.extensions import db as _db
+from app.fragments import listing_card_cache
+from app.models import Listing, Loan
+from app.utils import TTLCache
+
+
+def listing_version(listing_id):
+    _db.session.expire_all()
+    return _db.session.get(Listing, listing_id).version
+
+
+def test_listing_version_follows_listing_and_loan_changes(library):
+    listing_id = library["listing"]
+    assert listing_version(listing_id) == 1
+
+    listing = _db.session.get(Listing, listing_id)
+    listing.title = 'Dune Messiah'
+    _db.session.commit()
+    assert listing_version(listing_id) == 2
+
+    loan = Loan(listing_id=listing_id, user_id=library["reader"], start_date=date(2025, 2, 1),
+                return_date=date(2025, 2, 22))
+    _db.session.add(loan)
+    _db.session.commit()
+    assert listing_version(listing_id) == 3
+
+    loan.is_returned = True
+    _db.session.commit()
+    assert listing_version(listing_id) == 4
+
+    assert Listing.claim_for_loan(_db.session, listing_id)
+    _db.session.commit()
+    assert listing_version(listing_id) == 5
+
+
+def test_unchanged_listing_keeps_its_version(library):
+    listing = _db.session.get(Listing, library["listing"])
+    listing.title = listing.title
+    _db.session.commit()
+    assert listing_version(library["listing"]) == 1
+
+
+def test_cards_are_served_from_cache_until_the_listing_changes(client, log_in, library):
+    log_in(library["reader"])
+
+    client.get('/view_listings?scope=all')
+    assert listing_card_cache.stats()["misses"] == 1
+    client.get('/view_listings?scope=all')
+    assert listing_card_cache.stats()["hits"] == 1
+
+    listing = _db.session.get(Listing, library["listing"])
+    listing.title = 'Dune Messiah'
+    _db.session.commit()
+    _db.session.expunge_all()
+
+    response = client.get('/view_listings?scope=all')
+    assert listing_card_cache.stats()["misses"] == 2
+    assert b'Dune Messiah' in response.data
+
+
+def test_reservation_renders_a_new_card(client, log_in, library):
+    log_in(library["reader"])
+    assert b'Reserve this book' in client.get('/view_listings?scope=all').data
+
+    client.post('/reserve_book', data={'reserve': 'on', 'listing_id': library["listing"]})
+    _db.session.expunge_all()
+    response = client.get('/view_listings?scope=all')
+
+    due = (date.today() + timedelta(days=22)).strftime("%d/%m/%Y")
+    assert f'Please check back on: {due}'.encode() in response.data
+
+
+@pytest.mark.parametrize('viewer, expected, unexpected', [
+    ('owner', b'You cannot reserve your own book', b'Reserve this book'),
+    ('reader', b'Reserve this book', b'Edit book details'),
+    ('admin', b'Edit book details', b'You cannot reserve your own book'),
+])
+def test_cards_are_cached_per_kind_of_viewer(client, log_in, library, viewer, expected, unexpected):
+    #Every kind of viewer renders the card first, so the last one must not reuse another's card
+    for user in ('owner', 'reader', 'admin'):
+        log_in(library[user])
+        client.get('/view_listings?scope=all')
+    log_in(library[viewer])
+
+    response = client.get('/view_listings?scope=all')
+    assert expected in response.data
+    assert unexpected not in response.data
+    assert listing_card_cache.stats()["size"] == 3
+
+
+def test_ttl_cache_drops_least_recently_used_entry():
+    cache = TTLCache(ttl=60, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
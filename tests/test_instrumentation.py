@@ -0,0 +1,60 @@
+from app.instrumentation import percentile, request_metrics
+
+
+def test_percentile_uses_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([7], 99) == 7
+
+
+def test_stats_header_matches_queries_run(app, client, log_in, library, query_counter):
+    app.config['REQUEST_STATS_HEADER'] = True
+    log_in(library["reader"])
+    query_counter.clear()
+
+    response = client.get('/dashboard')
+
+    assert int(response.headers['X-Query-Count']) == len(query_counter)
+    timing = response.headers['Server-Timing']
+    assert f'db;desc="{len(query_counter)} queries"' in timing
+    assert 'template;dur=' in timing and 'total;dur=' in timing
+
+
+def test_stats_header_off_by_default(client):
+    response = client.get('/login')
+    assert 'Server-Timing' not in response.headers
+
+
+def test_requests_are_aggregated_per_endpoint(client, log_in, library):
+    log_in(library["reader"])
+    for _ in range(3):
+        client.get('/dashboard')
+    client.get('/login')
+
+    rows = {row["endpoint"]: row for row in request_metrics.summary()}
+
+    assert rows["dash.dashboard"]["requests"] == 3
+    assert rows["dash.dashboard"]["avg_queries"] > 0
+    assert rows["dash.dashboard"]["avg_template_ms"] > 0
+    assert rows["dash.dashboard"]["p50"] <= rows["dash.dashboard"]["p99"]
+    assert rows["auth.login"]["requests"] == 1
+
+
+def test_performance_page_admin_only(client, log_in, library):
+    log_in(library["reader"])
+    assert client.get('/performance').status_code == 302
+
+
+def test_performance_page_lists_endpoints(client, log_in, library):
+    log_in(library["admin"])
+    client.get('/dashboard')
+
+    response = client.get('/performance')
+
+    assert response.status_code == 200
+    assert b'dash.dashboard' in response.data
+    stats = client.get('/system_stats').get_json()
+    assert any(row["endpoint"] == "admin.performance" for row in stats["requests"])
+    assert "site_metrics" in stats["caches"]
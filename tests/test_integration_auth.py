@@ -1,6 +1,8 @@
 import pytest
 from app.extensions import db as _db
 from app.models import User
+from app.services.user_service import UserService, load_user_snapshot
+from app.services.admin_service import AdminService
 from datetime import date
 from unittest.mock import patch
 import os
@@ -192,3 +194,40 @@ def test_logout(client, app):
     assert b"Login" in response.data
 
     assert b"You have been logged out" in response.data
+
+
+def test_user_loader_caches_snapshot(app, member, query_counter):
+    user_id = member.user_id
+    _db.session.expunge_all()
+    query_counter.clear()
+
+    first = load_user_snapshot(_db.session, user_id)
+    second = load_user_snapshot(_db.session, user_id)
+
+    assert second is first
+    assert (second.username, second.is_admin) == ('member', False)
+    assert len([s for s in query_counter if 'FROM user' in s]) == 1
+
+
+def test_update_user_refreshes_snapshot(app, member):
+    load_user_snapshot(_db.session, member.user_id)
+
+    UserService(_db.session).update_user(member, 'renamed', None, None, None)
+
+    assert load_user_snapshot(_db.session, member.user_id).username == 'renamed'
+
+
+def test_role_change_refreshes_snapshot(app, member):
+    assert load_user_snapshot(_db.session, member.user_id).is_admin is False
+
+    AdminService(_db.session).update_user_role(member.user_id, 'admin')
+
+    assert load_user_snapshot(_db.session, member.user_id).is_admin is True
+
+
+def test_deleted_user_snapshot_is_dropped(app, member):
+    load_user_snapshot(_db.session, member.user_id)
+
+    AdminService(_db.session).delete_record(User, member.user_id)
+
+    assert load_user_snapshot(_db.session, member.user_id) is None
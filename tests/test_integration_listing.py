@@ -1,5 +1,9 @@
 import pytest
-from app.models import User, Genre, Listing
+import threading
+from app import create_app
+from app.models import User, Genre, Listing, Loan, SiteCounter
+from app.services.dashboard_service import DashboardService
+from app.services.listing_service import ListingService
 from app.extensions import db as _db
 from datetime import date
 
@@ -105,7 +109,7 @@ def test_edit_listing_route_success(logged_in_client, test_user, test_genre):
         assert updated.author == 'New Author'
 
 
-def test_reserve_book_route_success(logged_in_client, other_user, test_genre):
+def test_reserve_book_route_success(logged_in_client, test_user, other_user, test_genre):
     with logged_in_client.application.app_context():
         listing = Listing(
             title="Book to Reserve",
@@ -134,9 +138,194 @@ def test_reserve_book_route_success(logged_in_client, other_user, test_genre):
     with logged_in_client.application.app_context():
         reserved_listing = _db.session.get(Listing, listing_id)
         assert reserved_listing.is_available is False
+        assert reserved_listing.active_loan.user_id == test_user.user_id
+
+
+def test_returning_a_loan_clears_the_active_loan(logged_in_client, test_user, other_user, test_genre):
+    listing = Listing(title="Borrowed", author="Author", genre_id=test_genre.genre_id,
+                      user_id=other_user.user_id, is_available=True, date_listed=date.today())
+    _db.session.add(listing)
+    _db.session.commit()
+
+    logged_in_client.post('/reserve_book', data={'reserve': 'Reserve', 'listing_id': str(listing.listing_id)})
+    loan_id = listing.active_loan_id
+    assert loan_id is not None
+
+    logged_in_client.post('/update_loan', data={'returned': 'on', 'loan_id': str(loan_id)})
+    assert listing.active_loan_id is None
+    assert Listing.active_loan_drift(_db.session) == {}
+
+
+def test_repair_active_loans_fixes_drift(app, test_user, other_user, test_genre):
+    _add_listings_with_loans(test_user, other_user, test_genre, 0, 2)
+    first, second = Listing.query.order_by(Listing.listing_id).all()
+    expected = first.active_loan_id
+    _db.session.execute(Listing.__table__.update().values(active_loan_id=None))
+    _db.session.commit()
+
+    drift = Listing.active_loan_drift(_db.session)
+    assert drift[first.listing_id] == expected and set(drift) == {first.listing_id, second.listing_id}
+
+    Listing.repair_active_loans(_db.session)
+    _db.session.commit()
+    assert Listing.active_loan_drift(_db.session) == {}
+    _db.session.refresh(first)
+    assert first.active_loan_id == expected
 
 
 def test_view_listings_route(logged_in_client):
     response = logged_in_client.get('/view_listings')
     assert response.status_code == 200
     assert b"Listings" in response.data or b"Books" in response.data
+
+
+def _add_listings_with_loans(owner, borrower, genre, start, stop):
+    for i in range(start, stop):
+        listing = Listing(
+            title=f"Book {i}",
+            author="Author",
+            description="Desc",
+            genre_id=genre.genre_id,
+            user_id=owner.user_id,
+            is_available=False,
+            date_listed=date.today(),
+        )
+        _db.session.add(listing)
+        _db.session.flush()
+        active = Loan(listing_id=listing.listing_id, user_id=borrower.user_id,
+                      start_date=date.today(), return_date=date.today(), is_returned=False)
+        _db.session.add_all([
+            Loan(listing_id=listing.listing_id, user_id=borrower.user_id,
+                 start_date=date.today(), return_date=date.today(),
+                 actual_return_date=date.today(), is_returned=True),
+            active,
+        ])
+        listing.current_loan = active
+    _db.session.commit()
+
+
+@pytest.mark.parametrize("scope", ["self", "all"])
+def test_view_listings_query_count_is_fixed(logged_in_client, query_counter, test_user, other_user, test_genre, scope):
+    _add_listings_with_loans(test_user, other_user, test_genre, 0, 2)
+    logged_in_client.get(f'/view_listings?scope={scope}')
+    _db.session.expire_all()
+    query_counter.clear()
+    response = logged_in_client.get(f'/view_listings?scope={scope}')
+    assert response.status_code == 200
+    small_page_queries = len(query_counter)
+
+    _add_listings_with_loans(test_user, other_user, test_genre, 2, 10)
+    _db.session.expire_all()
+    query_counter.clear()
+    response = logged_in_client.get(f'/view_listings?scope={scope}')
+    assert response.status_code == 200
+    assert b"Book 9" in response.data
+
+    assert len(query_counter) == small_page_queries
+
+
+@pytest.mark.parametrize("sort_order", ["desc", "asc"])
+def test_listing_keyset_pagination_walks_every_row(app, test_user, test_genre, query_counter, sort_order):
+    for i in range(25):
+        _db.session.add(Listing(
+            title=f"Paged {i}",
+            user_id=test_user.user_id,
+            genre_id=test_genre.genre_id,
+            date_listed=date(2025, 1, 1 + i % 5),
+        ))
+    _db.session.commit()
+    query_counter.clear()
+
+    pages, cursor = [], None
+    while True:
+        page = Listing.filter_search_listings(_db.session, sort_order=sort_order, cursor=cursor, page_size=10)
+        pages.append([listing.listing_id for listing in page.items])
+        cursor = page.next_cursor
+        if not cursor:
+            break
+
+    seen = [listing_id for ids in pages for listing_id in ids]
+    assert [len(ids) for ids in pages] == [10, 10, 5]
+    assert sorted(seen) == sorted(set(seen))
+    assert len(seen) == 25
+    #Later pages seek past the cursor key instead of skipping earlier rows
+    assert all("WHERE listing.date_listed" in statement for statement in query_counter[1:])
+
+    #Walking back from the last page returns the middle page again
+    last_page = Listing.filter_search_listings(_db.session, sort_order=sort_order, cursor=page.prev_cursor, page_size=10)
+    assert [listing.listing_id for listing in last_page.items] == pages[1]
+
+
+def test_view_listings_renders_one_page(logged_in_client, app, test_user, test_genre):
+    app.config['PAGE_SIZE'] = 3
+    for i in range(5):
+        _db.session.add(Listing(title=f"Paged {i}", user_id=test_user.user_id,
+                                genre_id=test_genre.genre_id, date_listed=date(2025, 1, 1 + i)))
+    _db.session.commit()
+
+    response = logged_in_client.get('/view_listings?scope=self')
+    assert response.status_code == 200
+    assert b"Paged 4" in response.data
+    assert b"Paged 1" not in response.data
+    assert b"cursor=" in response.data
+
+
+def test_check_active_loans_command_repairs(app, test_user, other_user, test_genre):
+    _add_listings_with_loans(test_user, other_user, test_genre, 0, 1)
+    _db.session.execute(Listing.__table__.update().values(active_loan_id=None))
+    _db.session.commit()
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['check-active-loans'])
+    assert "1 listing(s) out of step" in result.output
+
+    result = runner.invoke(args=['check-active-loans', '--repair'])
+    assert "Repaired 1 listing(s)." in result.output
+    assert Listing.active_loan_drift(_db.session) == {}
+
+
+def test_concurrent_reservations_have_one_winner(tmp_path):
+    #A file database so every thread gets its own connection
+    app = create_app(testing=True, config={"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'race.db'}"})
+    books, readers = 3, 8
+    with app.app_context():
+        owner = User(username="owner", password_hash="x", role="regular")
+        _db.session.add(owner)
+        _db.session.add_all(User(username=f"reader{i}", password_hash="x", role="regular") for i in range(readers))
+        _db.session.flush()
+        _db.session.add_all(Listing(title=f"Book {i}", user_id=owner.user_id, is_available=True,
+                                    date_listed=date.today()) for i in range(books))
+        _db.session.commit()
+        listing_ids = [listing.listing_id for listing in Listing.query.all()]
+        reader_ids = [user.user_id for user in User.query.filter(User.username != "owner")]
+
+    barrier = threading.Barrier(readers)
+    outcomes = []
+
+    def reserve_all(user_id):
+        with app.app_context():
+            service = ListingService(_db.session, DashboardService(_db.session))
+            barrier.wait()
+            for listing_id in listing_ids:
+                result = service.reserve_book(user_id, listing_id)
+                outcomes.append((listing_id, result.success, result.message))
+            _db.session.remove()
+
+    threads = [threading.Thread(target=reserve_all, args=(user_id,)) for user_id in reader_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for listing_id in listing_ids:
+        results = [(success, message) for lid, success, message in outcomes if lid == listing_id]
+        assert sum(success for success, _ in results) == 1, results
+        assert all(success or "not available" in message for success, message in results)
+
+    with app.app_context():
+        assert Loan.query.count() == books
+        assert sum(user.total_loans or 0 for user in User.query) == books
+        assert SiteCounter.get_values(_db.session, ["total_overall_loans"])["total_overall_loans"] == books
+        assert Listing.active_loan_drift(_db.session) == {}
+        _db.session.remove()
+        _db.engine.dispose()
@@ -0,0 +1,148 @@
+import os
+import pytest
+from sqlalchemy.engine import make_url
+from app.models import User, Listing, Loan
+from app.extensions import db as _db
+from app.search import build_match_query, FTS_TABLE
+from sqlalchemy import text
+from datetime import date
+
+# Full-text search uses SQLite FTS5, other databases fall back to LIKE
+pytestmark = pytest.mark.skipif(
+    make_url(os.environ.get('TEST_DATABASE_URL', 'sqlite://')).get_backend_name() != 'sqlite',
+    reason="full-text search is SQLite only")
+
+
+@pytest.fixture
+def owner(app):
+    user = User(username="owner", role="regular", total_loans=0, total_listings=0)
+    user.set_password("password")
+    _db.session.add(user)
+    _db.session.commit()
+    yield user
+
+
+@pytest.fixture
+def books(app, owner):
+    listings = [
+        Listing(title="The Shining", author="Stephen King", description="A haunted hotel",
+                user_id=owner.user_id, date_listed=date(2025, 1, 1)),
+        Listing(title="Shine On", author="Ann Author", description="Stephen appears in the story",
+                user_id=owner.user_id, date_listed=date(2025, 1, 2)),
+        Listing(title="Minority Report", author="Philip K Dick", description="Futuristic",
+                user_id=owner.user_id, date_listed=date(2025, 1, 3)),
+    ]
+    _db.session.add_all(listings)
+    _db.session.commit()
+    yield listings
+
+
+def _titles(listings):
+    return sorted(listing.title for listing in listings)
+
+
+def test_build_match_query():
+    assert build_match_query("stephen ki") == '"stephen"* "ki"*'
+    assert build_match_query('"; DROP') == '"DROP"*'
+    assert build_match_query("!!!") is None
+
+
+def test_fts_installed_for_sqlite(app):
+    assert app.config["LISTING_FTS_ENABLED"] is True
+
+
+def test_prefix_search_matches_title_author_and_description(app, books):
+    assert _titles(Listing.filter_search_listings(_db.session, search="shin")) == ["Shine On", "The Shining"]
+    assert _titles(Listing.filter_search_listings(_db.session, search="king")) == ["The Shining"]
+    assert _titles(Listing.filter_search_listings(_db.session, search="haunted")) == ["The Shining"]
+
+
+def test_relevance_sort_prefers_title_and_author_matches(app, books):
+    ranked = Listing.filter_search_listings(_db.session, search="stephen", sort_order='relevance')
+    assert [listing.title for listing in ranked] == ["The Shining", "Shine On"]
+    #Newest first otherwise
+    by_date = Listing.filter_search_listings(_db.session, search="stephen")
+    assert [listing.title for listing in by_date] == ["Shine On", "The Shining"]
+
+
+def test_relevance_pages_follow_rank(app, owner):
+    _db.session.add_all([
+        Listing(title=f"Dune {'dune ' * weight}", author="Frank Herbert", user_id=owner.user_id,
+                date_listed=date(2025, 1, weight))
+        for weight in range(1, 6)
+    ])
+    _db.session.commit()
+    ranked = [listing.title for listing in
+              Listing.filter_search_listings(_db.session, search="dune", sort_order='relevance')]
+
+    titles, cursor = [], None
+    while True:
+        page = Listing.filter_search_listings(_db.session, search="dune", sort_order='relevance',
+                                              cursor=cursor, page_size=2)
+        titles += [listing.title for listing in page]
+        if not page.next_cursor:
+            break
+        cursor = page.next_cursor
+    assert titles == ranked
+    assert len(set(titles)) == 5
+
+    #And back again from the last page
+    previous = Listing.filter_search_listings(_db.session, search="dune", sort_order='relevance',
+                                              cursor=page.prev_cursor, page_size=2)
+    assert [listing.title for listing in previous] == ranked[2:4]
+
+
+def test_search_page_lists_best_match_first(client, books, owner):
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(owner.user_id)
+    page = client.get('/view_listings?scope=all&search=stephen').data.decode()
+    assert page.index("The Shining") < page.index("Shine On")
+
+
+def test_index_follows_updates_and_deletes(app, books):
+    shining = books[0]
+    shining.title = "Doctor Sleep"
+    _db.session.commit()
+    assert _titles(Listing.filter_search_listings(_db.session, search="doctor")) == ["Doctor Sleep"]
+    assert _titles(Listing.filter_search_listings(_db.session, search="shining")) == []
+
+    _db.session.delete(books[2])
+    _db.session.commit()
+    assert Listing.filter_search_listings(_db.session, search="minority") == []
+
+
+def test_loan_search_uses_listing_index(app, books, owner):
+    borrower = User(username="borrower", role="regular")
+    borrower.set_password("password")
+    _db.session.add(borrower)
+    _db.session.flush()
+    _db.session.add(Loan(listing_id=books[2].listing_id, user_id=borrower.user_id,
+                         start_date=date(2025, 2, 1), return_date=date(2025, 2, 21)))
+    _db.session.commit()
+
+    assert len(Loan.filter_search_loans(_db.session, search="philip")) == 1
+    assert len(Loan.filter_search_loans(_db.session, search="borrow")) == 1
+    assert Loan.filter_search_loans(_db.session, search="shining") == []
+
+
+def test_like_fallback_when_fts_disabled(app, books):
+    app.config["LISTING_FTS_ENABLED"] = False
+    assert _titles(Listing.filter_search_listings(_db.session, search="hining")) == ["The Shining"]
+
+
+def test_rebuild_command_repopulates_index(app, books):
+    _db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')"))
+    _db.session.commit()
+    assert Listing.filter_search_listings(_db.session, search="shining") == []
+
+    result = app.test_cli_runner().invoke(args=["rebuild-search-index"])
+
+    assert "rebuilt" in result.output
+    assert _titles(Listing.filter_search_listings(_db.session, search="shining")) == ["The Shining"]
+
+
+def test_like_fallback_searches_descriptions_too(app, books, monkeypatch):
+    #Without a full-text index (e.g. on MySQL) the same columns are searched
+    monkeypatch.setattr('app.models.matching_listing_ids', lambda search: None)
+    assert _titles(Listing.filter_search_listings(_db.session, search="haunted")) == ["The Shining"]
+    assert _titles(Listing.filter_search_listings(_db.session, search="futuristic")) == ["Minority Report"]
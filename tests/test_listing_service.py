@@ -229,7 +229,8 @@ def test_reserve_book_exception(mock_db_session):
 
     mock_user = MagicMock()
     mock_listing = MagicMock()
-    mock_listing.save.side_effect = Exception("DB failure")
+    mock_db_session.execute.return_value.rowcount = 1
+    mock_db_session.commit.side_effect = Exception("DB failure")
     mock_db_session.get.side_effect = lambda model, id: {
         User: mock_user,
     }.get(model)
@@ -240,6 +241,28 @@ def test_reserve_book_exception(mock_db_session):
         assert "Error reserving book" in result.message
 
 
+def test_reserve_book_claim_lost(mock_db_session):
+    mock_dashboard_service = MagicMock()
+    listing_service = ListingService(mock_db_session, mock_dashboard_service)
+
+    mock_listing = MagicMock()
+    mock_listing.is_available = True
+    #Another reservation claimed the listing after it was read
+    mock_db_session.execute.return_value.rowcount = 0
+    listing_service.get_record_by_id = MagicMock(side_effect=[
+        Result(True, "Listing found", mock_listing),
+        Result(True, "User found", MagicMock())
+    ])
+
+    result = listing_service.reserve_book(user_id=1, listing_id=1)
+
+    assert result.success is False
+    assert "not available" in result.message
+    #Nothing is staged once the claim is lost
+    mock_db_session.add.assert_not_called()
+    mock_dashboard_service.update_overall_loans.assert_not_called()
+
+
 def test_update_loan_success(mock_db_session):
 
     mock_loan = MagicMock()
@@ -0,0 +1,139 @@
+import os
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from app.migrations import run_migrations, set_not_null_sql
+from app.models import User, Genre, Listing
+from app.extensions import db as _db
+
+# The tables as created before the normalised columns and the listing's active loan pointer existed
+LEGACY_SCHEMA = [
+    """CREATE TABLE user (
+        user_id INTEGER PRIMARY KEY, username VARCHAR(30) NOT NULL UNIQUE,
+        password_hash VARCHAR(255) NOT NULL, role VARCHAR(50) NOT NULL,
+        marked_for_deletion BOOLEAN, total_loans INTEGER, total_listings INTEGER, join_date DATE)""",
+    """CREATE TABLE genre (
+        genre_id INTEGER PRIMARY KEY, name VARCHAR(20) NOT NULL UNIQUE, image VARCHAR(50))""",
+    """CREATE TABLE listing (
+        listing_id INTEGER PRIMARY KEY, title VARCHAR(150) NOT NULL, author VARCHAR(50),
+        description VARCHAR(400), genre_id INTEGER REFERENCES genre (genre_id), is_available BOOLEAN NOT NULL,
+        marked_for_deletion BOOLEAN, user_id INTEGER NOT NULL REFERENCES user (user_id) ON DELETE CASCADE,
+        date_listed DATE)""",
+    """CREATE TABLE loan (
+        loan_id INTEGER PRIMARY KEY, listing_id INTEGER NOT NULL REFERENCES listing (listing_id) ON DELETE CASCADE,
+        user_id INTEGER NOT NULL REFERENCES user (user_id) ON DELETE CASCADE, start_date DATE, return_date DATE,
+        actual_return_date DATE, is_returned BOOLEAN)""",
+    "INSERT INTO user (username, password_hash, role, join_date) VALUES ('Clive', 'x', 'admin', '2024-06-10')",
+    "INSERT INTO listing (title, is_available, user_id) VALUES ('Dune', 0, 1)",
+    "INSERT INTO loan (listing_id, user_id, is_returned) VALUES (1, 1, 1)",
+    "INSERT INTO loan (listing_id, user_id, is_returned) VALUES (1, 1, 0)",
+    "INSERT INTO genre (name, image) VALUES ('Fantasy', 'images/fantasy.png')",
+]
+
+
+@pytest.fixture
+def legacy_engine(tmp_path, app):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        for statement in LEGACY_SCHEMA:
+            connection.exec_driver_sql(statement)
+        _db.metadata.create_all(connection)
+    yield engine
+    engine.dispose()
+
+
+def test_migrations_backfill_normalized_names(legacy_engine):
+    run_migrations(legacy_engine)
+
+    with legacy_engine.connect() as connection:
+        assert connection.execute(text("SELECT username_normalized FROM user")).scalar() == "clive"
+        assert connection.execute(text("SELECT name_normalized FROM genre")).scalar() == "fantasy"
+        indexes = {index["name"]: index for index in inspect(connection).get_indexes("user")}
+        assert indexes["ix_user_username_normalized"]["unique"]
+
+
+def test_migrations_backfill_active_loan(legacy_engine):
+    run_migrations(legacy_engine)
+
+    with legacy_engine.connect() as connection:
+        assert connection.execute(text("SELECT active_loan_id FROM listing")).scalar() == 2
+        #Repointing the listing counts as a change to it
+        assert connection.execute(text("SELECT version FROM listing")).scalar() == 2
+        foreign_keys = inspect(connection).get_foreign_keys("listing")
+        assert any(fk["referred_table"] == "loan" for fk in foreign_keys)
+
+
+def test_migrations_are_idempotent(legacy_engine):
+    run_migrations(legacy_engine)
+    run_migrations(legacy_engine)
+
+    with legacy_engine.connect() as connection:
+        columns = [column["name"] for column in inspect(connection).get_columns("user")]
+        assert columns.count("username_normalized") == 1
+
+
+def test_normalized_username_follows_updates(app):
+    user = User(username="MixedCase", password_hash="x", role="regular")
+    _db.session.add(user)
+    _db.session.commit()
+    assert User.existing_user(_db.session, "MIXEDCASE") is user
+
+    user.username = "Renamed"
+    _db.session.commit()
+    assert user.username_normalized == "renamed"
+    assert User.existing_user(_db.session, "mixedcase") is None
+
+
+def test_genre_lookup_is_case_insensitive(app):
+    _db.session.add(Genre(name="Science Fiction", image="images/science.png"))
+    _db.session.commit()
+
+    assert Genre.exists_by_name(_db.session, "science fiction") is not None
+
+
+def test_migrations_date_undated_rows_so_every_page_is_reachable(legacy_engine):
+    with legacy_engine.begin() as connection:
+        for title in ('Emma', 'Ulysses'):
+            connection.exec_driver_sql(f"INSERT INTO listing (title, is_available, user_id) VALUES ('{title}', 1, 1)")
+    run_migrations(legacy_engine)
+
+    with legacy_engine.connect() as connection:
+        for table, column in (("user", "join_date"), ("listing", "date_listed"), ("loan", "start_date")):
+            assert connection.execute(text(f"SELECT COUNT(*) FROM {table} WHERE {column} IS NULL")).scalar() == 0
+
+    #Walk every keyset page of the three listings, two at a time
+    with Session(legacy_engine) as session:
+        page = Listing.paginate_keyset(session.query(Listing), Listing.date_listed, page_size=2)
+        titles = [listing.title for listing in page]
+        page = Listing.paginate_keyset(session.query(Listing), Listing.date_listed,
+                                       cursor=page.next_cursor, page_size=2)
+        titles += [listing.title for listing in page]
+    assert sorted(titles) == ['Dune', 'Emma', 'Ulysses']
+
+
+@pytest.mark.parametrize('dialect, expected', [
+    (mysql.dialect(), "ALTER TABLE listing MODIFY date_listed DATE NOT NULL"),
+    (postgresql.dialect(), "ALTER TABLE listing ALTER COLUMN date_listed SET NOT NULL"),
+    (sqlite.dialect(), None),
+])
+def test_sort_dates_are_made_not_null(dialect, expected):
+    assert set_not_null_sql(dialect, Listing.__table__.c.date_listed) == expected
+
+
+@pytest.mark.skipif(make_url(os.environ.get('TEST_DATABASE_URL', 'sqlite://')).get_backend_name() == 'sqlite',
+                    reason="SQLite cannot add NOT NULL to an existing column")
+def test_sort_dates_are_not_null_after_migrating(app):
+    #Start from the nullable columns of an older schema
+    with _db.engine.begin() as connection:
+        for column in (User.__table__.c.join_date, Listing.__table__.c.date_listed):
+            statement = set_not_null_sql(connection.dialect, column)
+            connection.exec_driver_sql(statement.replace("SET NOT NULL", "DROP NOT NULL")
+                                       .replace("DATE NOT NULL", "DATE NULL"))
+    run_migrations(_db.engine)
+
+    with _db.engine.connect() as connection:
+        for table, column in (("user", "join_date"), ("listing", "date_listed"), ("loan", "start_date")):
+            columns = {info['name']: info for info in inspect(connection).get_columns(table)}
+            assert columns[column]['nullable'] is False
@@ -0,0 +1,111 @@
+import threading
+import pytest
+from unittest.mock import patch
+from werkzeug.security import generate_password_hash
+from app.extensions import db as _db
+from app.models import User
+from app.passwords import (hash_password, needs_rehash, DEFAULT_HASH_METHOD, HashingPool,
+                           HashingBusy, hashing_pool)
+from app.services.user_service import UserService
+
+FAST_METHOD = 'pbkdf2:sha256:1000'
+
+
+def test_hash_uses_configured_method(app):
+    app.config['PASSWORD_HASH_METHOD'] = FAST_METHOD
+
+    password_hash = hash_password('secret')
+
+    assert password_hash.startswith('pbkdf2:sha256:1000$')
+    assert not needs_rehash(password_hash)
+
+
+def test_needs_rehash_on_method_or_cost_change(app):
+    app.config['PASSWORD_HASH_METHOD'] = 'scrypt'
+    #Werkzeug's default scrypt parameters count as the same policy
+    assert not needs_rehash(hash_password('secret'))
+
+    app.config['PASSWORD_HASH_METHOD'] = FAST_METHOD
+    assert needs_rehash(hash_password('secret').replace(':1000$', ':2000$', 1))
+    assert needs_rehash(generate_password_hash('secret', method=DEFAULT_HASH_METHOD))
+
+
+def test_login_rehashes_to_current_policy(app):
+    user = User(username='member', role='regular')
+    user.set_password('memberpass')
+    _db.session.add(user)
+    _db.session.commit()
+    assert user.password_hash.startswith('scrypt:')
+
+    app.config['PASSWORD_HASH_METHOD'] = FAST_METHOD
+    result = UserService(_db.session).user_login('member', 'memberpass')
+
+    assert result.success is True
+    _db.session.refresh(user)
+    assert user.password_hash.startswith('pbkdf2:sha256:1000$')
+    assert user.verify_password('memberpass')
+
+
+def test_failed_login_does_not_rehash(app):
+    user = User(username='member', role='regular')
+    user.set_password('memberpass')
+    _db.session.add(user)
+    _db.session.commit()
+    original = user.password_hash
+
+    app.config['PASSWORD_HASH_METHOD'] = FAST_METHOD
+    assert UserService(_db.session).user_login('member', 'wrongpass').success is False
+
+    _db.session.refresh(user)
+    assert user.password_hash == original
+
+
+def test_hashing_pool_rejects_when_full():
+    pool = HashingPool(workers=1, max_queue=0)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_hash():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    worker = threading.Thread(target=pool.run, args=(slow_hash,))
+    worker.start()
+    started.wait(5)
+
+    with pytest.raises(HashingBusy):
+        pool.run(lambda: "never runs")
+    assert pool.stats()["running"] == 1
+
+    release.set()
+    worker.join()
+    stats = pool.stats()
+    assert (stats["completed"], stats["rejected"], stats["running"]) == (1, 1, 0)
+    assert pool.run(lambda: "ok") == "ok"
+
+
+def test_login_returns_busy_when_pool_is_full(app):
+    user = User(username='member', role='regular')
+    user.set_password('memberpass')
+    _db.session.add(user)
+    _db.session.commit()
+
+    with patch.object(hashing_pool, 'run', side_effect=HashingBusy()):
+        result = UserService(_db.session).user_login('member', 'memberpass')
+
+    assert result.success is False
+    assert "try again" in result.message
+
+
+def test_system_stats_reports_hashing_pool(app, client):
+    admin = User(username='admin', role='admin')
+    admin.set_password('adminpass')
+    _db.session.add(admin)
+    _db.session.commit()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(admin.user_id)
+
+    stats = client.get('/system_stats').get_json()["password_hashing"]
+
+    assert stats["workers"] == app.config["HASHING_WORKERS"]
+    assert stats["completed"] >= 1
@@ -0,0 +1,67 @@
+import pytest
+from datetime import date, timedelta
+from app.extensions import db as _db
+from app.models import User, Listing, Loan, Genre
+
+PAGE_SIZE = 5
+#Every table holds several pages, so a query that loads a whole table goes over budget
+ROWS = PAGE_SIZE * 4
+#Instances of one model a page may load: its rows plus the records they refer to
+INSTANCE_BUDGET = PAGE_SIZE * 2 + 2
+#Statements a page may run, lazy loads per row would go over
+QUERY_BUDGET = 8
+
+PAGES = [
+    ('regular', '/dashboard'),
+    ('regular', '/view_listings?scope=all'),
+    ('regular', '/view_listings?scope=all&search=book'),
+    ('regular', '/view_listings?scope=self'),
+    ('regular', '/view_loans?scope=self'),
+    ('admin', '/view_loans?scope=all'),
+    ('admin', '/view_users'),
+]
+
+
+@pytest.fixture
+def catalogue(app):
+    """Several pages of users, listings and loans, with half the listings out on loan"""
+    app.config['PAGE_SIZE'] = PAGE_SIZE
+    genre = Genre(name='Fantasy', image='images/fantasy.png')
+    users = {role: User(username=role, role=role, password_hash='x', total_loans=0, total_listings=0)
+             for role in ('regular', 'admin')}
+    others = [User(username=f'reader{i}', role='regular', password_hash='x') for i in range(ROWS)]
+    _db.session.add_all([genre, *users.values(), *others])
+    _db.session.flush()
+
+    start = date(2025, 1, 1)
+    for i in range(ROWS):
+        for owner in (users['regular'], others[i]):
+            listing = Listing(title=f'Book {i}', author='Author', description='Desc', genre=genre,
+                              user=owner, date_listed=start + timedelta(days=i),
+                              is_available=i % 2 == 0)
+            _db.session.add(listing)
+            borrower = others[(i + 1) % ROWS] if owner is users['regular'] else users['regular']
+            for n in range(2):
+                loan = Loan(listing=listing, user=borrower, start_date=start + timedelta(days=i + n),
+                            return_date=start + timedelta(days=i + n + 14), is_returned=n == 0 or i % 2 == 0)
+                _db.session.add(loan)
+                if not loan.is_returned:
+                    listing.current_loan = loan
+    _db.session.commit()
+    return {role: user.user_id for role, user in users.items()}
+
+
+@pytest.mark.parametrize('role, path', PAGES)
+def test_page_stays_within_query_budget(client, catalogue, query_counter, instance_loads, role, path):
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(catalogue[role])
+    #Start from an empty identity map, as a new request does
+    _db.session.expunge_all()
+    query_counter.clear()
+
+    response = client.get(path)
+
+    assert response.status_code == 200
+    assert len(query_counter) <= QUERY_BUDGET, query_counter
+    over_budget = {model: count for model, count in instance_loads.items() if count > INSTANCE_BUDGET}
+    assert not over_budget, f"{path} loaded {over_budget}"
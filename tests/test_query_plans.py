@@ -0,0 +1,88 @@
+import os
+import pytest
+import re
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from app.models import User, Listing, Loan, Genre
+from app.extensions import db as _db
+from app.services.dashboard_service import DashboardService
+from datetime import date
+
+# EXPLAIN QUERY PLAN output is SQLite's, skip when TEST_DATABASE_URL points elsewhere
+pytestmark = pytest.mark.skipif(
+    make_url(os.environ.get('TEST_DATABASE_URL', 'sqlite://')).get_backend_name() != 'sqlite',
+    reason="query plans are checked on SQLite only")
+
+# A plan step that reads a whole table without an index, e.g. "SCAN listing"
+FULL_SCAN = re.compile(r"^SCAN (user|listing|loan)( AS \w+)?$")
+
+HOT_QUERIES = {
+    "listings page": lambda s: Listing.filter_search_listings(s, page_size=20),
+    "listings oldest first": lambda s: Listing.filter_search_listings(s, sort_order='asc', page_size=20),
+    "own listings": lambda s: Listing.filter_search_listings(s, user_id=1, page_size=20),
+    "listings by genre": lambda s: Listing.filter_search_listings(s, filter_genre="Fantasy", page_size=20),
+    "available listings": lambda s: Listing.filter_search_listings(s, filter_availability=True, page_size=20),
+    "listing deletion requests": lambda s: Listing.filter_search_listings(s, marked_for_deletion=True, page_size=20),
+    "listing cards": lambda s: Listing.filter_search_listings(s, render_profile='card', page_size=20),
+    "loans page": lambda s: Loan.filter_search_loans(s, page_size=20),
+    "own loans": lambda s: Loan.filter_search_loans(s, user_id=1, page_size=20),
+    "active loans": lambda s: Loan.filter_search_loans(s, filter_status='active', page_size=20),
+    "overdue loans": lambda s: Loan.filter_search_loans(s, filter_status='overdue', page_size=20),
+    "users page": lambda s: User.filter_search_query(s, page_size=20),
+    "users by role": lambda s: User.filter_search_query(s, filter_role='admin', page_size=20),
+    "user deletion requests": lambda s: User.filter_search_query(s, marked_for_deletion='true', page_size=20),
+    "login username lookup": lambda s: User.existing_user(s, "User1"),
+    "genre name lookup": lambda s: Genre.exists_by_name(s, "fantasy"),
+    "count admins": lambda s: User.count_admins(s),
+    "count listings by user": lambda s: Listing.count_by_user(s, 1),
+    "count available listings": lambda s: Listing.count_available(s),
+    "count active loans": lambda s: Loan.count_active(s),
+    "count active loans by user": lambda s: Loan.count_active_by_user(s, 1),
+    "dashboard user metrics": lambda s: DashboardService(s).user_metrics(1),
+}
+
+
+@pytest.fixture
+def catalogue(app):
+    genre = Genre(name="Fantasy", image="images/fantasy.png")
+    users = [User(username=f"user{i}", password_hash="x", role="admin" if i == 0 else "regular",
+                  join_date=date(2024, 1, 1 + i)) for i in range(5)]
+    _db.session.add_all([genre, *users])
+    _db.session.flush()
+    for i in range(20):
+        listing = Listing(title=f"Book {i}", user_id=users[i % 5].user_id, genre_id=genre.genre_id,
+                          is_available=i % 2 == 0, date_listed=date(2025, 1, 1 + i))
+        _db.session.add(listing)
+        _db.session.flush()
+        _db.session.add(Loan(listing_id=listing.listing_id, user_id=users[(i + 1) % 5].user_id,
+                             start_date=date(2025, 2, 1 + i), return_date=date(2025, 2, 22),
+                             is_returned=i % 3 == 0))
+    _db.session.commit()
+
+
+def _capture_selects(run):
+    """Run a query function and return the SELECT statements (with parameters) it sent"""
+    captured = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    event.listen(_db.engine, "before_cursor_execute", record)
+    try:
+        run(_db.session)
+    finally:
+        event.remove(_db.engine, "before_cursor_execute", record)
+    return captured
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_uses_an_index(catalogue, name):
+    statements = _capture_selects(HOT_QUERIES[name])
+    assert statements, f"{name} sent no SELECT"
+
+    connection = _db.session.connection().connection.dbapi_connection
+    for statement, parameters in statements:
+        plan = [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+        full_scans = [step for step in plan if FULL_SCAN.match(step)]
+        assert not full_scans, f"{name} falls back to a full scan: {plan}"
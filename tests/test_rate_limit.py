@@ -0,0 +1,136 @@
+import pytest
+from unittest.mock import patch
+from app import create_app
+from app.extensions import db as _db
+from app.passwords import hashing_pool
+from app.utils import describe_wait
+from app.rate_limit import AuthRateLimiter, MemoryBucketStore, EVICT_INTERVAL, auth_rate_limiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_bucket_empties_and_refills(clock):
+    limiter = AuthRateLimiter(clock=clock)
+    limiter.configure(per_ip="3/30", per_username="100/60")
+
+    assert [limiter.allow('1.2.3.4') for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow('5.6.7.8') is True
+
+    #One token comes back every 10 seconds
+    clock.now += 10
+    assert limiter.allow('1.2.3.4') is True
+    assert limiter.allow('1.2.3.4') is False
+    assert limiter.rejected == 2
+
+
+def test_username_limit_ignores_case_and_ip(clock):
+    limiter = AuthRateLimiter(clock=clock)
+    limiter.configure(per_ip="100/60", per_username="2/60")
+
+    assert limiter.allow('1.1.1.1', 'Member') is True
+    assert limiter.allow('2.2.2.2', 'member') is True
+    assert limiter.allow('3.3.3.3', 'MEMBER') is False
+    assert limiter.allow('3.3.3.3', 'other') is True
+
+
+def test_idle_buckets_are_evicted():
+    store = MemoryBucketStore(max_idle=60)
+    store.take('ip:a', 5, 60, now=0)
+    store.take('ip:b', 5, 60, now=EVICT_INTERVAL)
+
+    store.take('ip:c', 5, 60, now=EVICT_INTERVAL + 30)
+
+    assert len(store) == 2
+
+
+def test_sqlite_storage_is_shared(tmp_path, clock):
+    path = str(tmp_path / 'limits.db')
+    first, second = AuthRateLimiter(clock=clock), AuthRateLimiter(clock=clock)
+    first.configure(per_ip="2/60", per_username="10/60", storage=path)
+    second.configure(per_ip="2/60", per_username="10/60", storage=path)
+
+    assert first.allow('1.2.3.4') is True
+    assert second.allow('1.2.3.4') is True
+    assert first.allow('1.2.3.4') is False
+    assert len(second.store) == 1
+
+
+def test_login_is_rejected_before_hashing(client):
+    auth_rate_limiter.configure(per_ip="100/60", per_username="2/60")
+    for _ in range(2):
+        client.post('/login', data={'username': 'member', 'password': 'wrong'})
+
+    with patch.object(hashing_pool, 'run') as run:
+        response = client.post('/login', data={'username': 'member', 'password': 'wrong'})
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '30'
+    assert b'Too many attempts, please wait 30 seconds' in response.data
+    run.assert_not_called()
+
+
+def test_wait_is_for_the_bucket_that_refused(clock):
+    limiter = AuthRateLimiter(clock=clock)
+    limiter.configure(per_ip="2/10", per_username="1/600")
+
+    assert limiter.check('1.1.1.1', 'member') == 0
+    #Only the username is over its limit, its token comes back in 10 minutes
+    assert limiter.check('1.1.1.1', 'member') == 600
+    #Only the IP is over its limit, a token comes back in 5 seconds
+    assert limiter.check('1.1.1.1', 'other') == 5
+    clock.now += 2
+    assert limiter.check('1.1.1.1', 'other') == 3
+
+
+def test_describe_wait():
+    assert describe_wait(1) == "1 second"
+    assert describe_wait(45) == "45 seconds"
+    assert describe_wait(600) == "10 minutes"
+    assert describe_wait(601) == "11 minutes"
+
+
+def test_register_is_limited_per_ip(client):
+    auth_rate_limiter.configure(per_ip="1/60", per_username="5/60")
+    client.post('/register', data={'username': 'first', 'password': 'password1'})
+
+    response = client.post('/register', data={'username': 'second', 'password': 'password1'})
+
+    assert response.status_code == 429
+    assert client.get('/login').status_code == 200
+
+
+def test_ip_limit_uses_forwarded_address_behind_proxy():
+    app = create_app(testing=True, config={"PROXY_FIX_X_FOR": 1})
+    auth_rate_limiter.configure(per_ip="1/60", per_username="100/60")
+    client = app.test_client()
+
+    for address in ('203.0.113.1', '203.0.113.2'):
+        response = client.post('/login', data={'username': 'member', 'password': 'wrong'},
+                               headers={'X-Forwarded-For': address})
+        assert response.status_code != 429
+    response = client.post('/login', data={'username': 'member', 'password': 'wrong'},
+                           headers={'X-Forwarded-For': '203.0.113.1'})
+    assert response.status_code == 429
+    with app.app_context():
+        _db.session.remove()
+
+
+def test_forwarded_address_is_ignored_by_default(client):
+    auth_rate_limiter.configure(per_ip="1/60", per_username="100/60")
+    client.post('/login', data={'username': 'member', 'password': 'wrong'},
+                headers={'X-Forwarded-For': '203.0.113.1'})
+
+    response = client.post('/login', data={'username': 'member', 'password': 'wrong'},
+                           headers={'X-Forwarded-For': '203.0.113.2'})
+    assert response.status_code == 429
@@ -0,0 +1,89 @@
+import sqlite3
+import pytest
+from datetime import date
+from flask import g
+from sqlalchemy import select
+from app import create_app
+from app.extensions import db as _db
+from app.models import User, Listing
+
+
+@pytest.fixture
+def replicated_app(tmp_path):
+    """An app on a primary SQLite file with one replica file, synced by copy_to_replica()"""
+    primary, replica = tmp_path / "primary.db", tmp_path / "replica.db"
+    app = create_app(testing=True, config={
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{primary}",
+        "SQLALCHEMY_REPLICA_URIS": [f"sqlite:///{replica}"],
+    })
+
+    def copy_to_replica():
+        with sqlite3.connect(primary) as source, sqlite3.connect(replica) as target:
+            source.backup(target)
+
+    with app.app_context():
+        user = User(username="reader", role="regular", total_loans=0, total_listings=0)
+        user.set_password("password")
+        _db.session.add(user)
+        _db.session.flush()
+        _db.session.add(Listing(title="Synced Book", author="Author", description="Desc",
+                                user_id=user.user_id, is_available=True, date_listed=date.today()))
+        _db.session.commit()
+        copy_to_replica()
+
+        #Only on the primary until the next copy
+        _db.session.add(Listing(title="Fresh Book", author="Author", description="Desc",
+                                user_id=user.user_id, is_available=True, date_listed=date.today()))
+        _db.session.commit()
+
+        app.copy_to_replica = copy_to_replica
+        app.user_id = user.user_id
+        yield app
+        _db.session.remove()
+        _db.engine.dispose()
+        for engine in app.extensions["replica_engines"]:
+            engine.dispose()
+
+
+@pytest.fixture
+def reader_client(replicated_app):
+    client = replicated_app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(replicated_app.user_id)
+    return client
+
+
+def test_read_only_route_reads_from_replica(reader_client):
+    response = reader_client.get('/view_listings?scope=all')
+
+    assert b"Synced Book" in response.data
+    assert b"Fresh Book" not in response.data
+
+
+def test_write_sticks_user_to_primary(reader_client):
+    reader_client.post('/create_listing', data={
+        'title': 'Written Book', 'author': 'Author', 'description': 'Desc', 'genre_id': ''})
+
+    response = reader_client.get('/view_listings?scope=all')
+
+    assert b"Written Book" in response.data
+    assert b"Fresh Book" in response.data
+
+
+def test_other_routes_read_from_primary(replicated_app):
+    with replicated_app.test_request_context('/'):
+        titles = _db.session.scalars(select(Listing.title)).all()
+        assert "Fresh Book" in titles
+
+
+def test_write_in_read_only_request_switches_to_primary(replicated_app):
+    with replicated_app.test_request_context('/'):
+        g.read_only_route = True
+        assert _db.session.scalar(select(Listing.title).where(Listing.title == "Fresh Book")) is None
+
+        _db.session.get(User, replicated_app.user_id).total_loans = 1
+        _db.session.flush()
+
+        assert _db.session.scalar(select(Listing.title).where(Listing.title == "Fresh Book")) == "Fresh Book"
+        _db.session.rollback()
+        g.read_only_route = False
@@ -0,0 +1,88 @@
+import pytest
+from datetime import date
+from sqlalchemy import func, select, inspect
+from app.extensions import db as _db
+from app.models import User, Listing, Loan, SiteCounter
+from app.scale_seed import seed_scale, SCALE_PASSWORD
+from app.search import fts_enabled, matching_listing_ids
+
+
+def seed(app, **volume):
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+    return seed_scale(_db.engine, seed=7, today=date(2025, 6, 1), **volume)
+
+
+def test_seeds_requested_volume(app):
+    counts = seed(app, users=40, listings=300, loans=500)
+
+    assert counts["listings"] == _db.session.scalar(select(func.count()).select_from(Listing)) == 300
+    assert _db.session.scalar(select(func.count()).select_from(User)) == 40
+    assert _db.session.scalar(select(func.count()).select_from(Loan)) == 500
+    assert SiteCounter.get_values(_db.session, ['total_overall_books', 'total_overall_loans']) == {
+        'total_overall_books': 300, 'total_overall_loans': 500}
+
+
+def test_seeded_data_is_consistent(app):
+    counts = seed(app, users=40, listings=300, loans=500)
+
+    #Every listing out on loan points at its single unreturned loan
+    assert Listing.active_loan_drift(_db.session) == {}
+    unavailable = _db.session.scalar(select(func.count()).where(Listing.is_available.is_(False)))
+    assert unavailable == counts["active_loans"] > 0
+
+    #User totals match the rows generated for them
+    assert _db.session.scalar(select(func.sum(User.total_listings))) == 300
+    assert _db.session.scalar(select(func.sum(User.total_loans))) == 500
+    user = _db.session.scalars(select(User).order_by(User.total_listings.desc())).first()
+    assert user.total_listings == Listing.count_by_user(_db.session, user.user_id)
+    assert user.verify_password(SCALE_PASSWORD)
+
+    #Indexes dropped for the load are rebuilt
+    index_names = {index['name'] for index in inspect(_db.engine).get_indexes('listing')}
+    assert {index.name for index in Listing.__table__.indexes} <= index_names
+
+
+def test_search_index_is_rebuilt(app):
+    seed(app, users=10, listings=50, loans=0)
+    if not fts_enabled():
+        return
+    title = _db.session.scalar(select(Listing.title).limit(1))
+
+    assert _db.session.execute(matching_listing_ids(title)).first() is not None
+
+    #The triggers are back, so new listings are indexed again
+    listing = Listing(title='Zanzibar Nights', author='A', description='B', user_id=1, date_listed=date.today())
+    _db.session.add(listing)
+    _db.session.commit()
+    assert _db.session.execute(matching_listing_ids('zanzibar')).scalar() == listing.listing_id
+
+
+def test_generated_usernames_do_not_collide(app):
+    #An existing user already has the name the first generated user would get
+    _db.session.add(User(username='reader1', role='regular', password_hash='x'))
+    _db.session.commit()
+
+    seed(app, users=5, listings=10, loans=0)
+    seed(app, users=5, listings=10, loans=0)
+
+    usernames = _db.session.scalars(select(User.username)).all()
+    assert len(usernames) == len(set(usernames)) == 11
+    assert 'reader2_2' in usernames and 'reader3_7' in usernames
+
+
+@pytest.mark.parametrize('option', [['--batch-size', '0'], ['--on-loan', '1.5']])
+def test_seed_scale_cli_rejects_bad_options(app, option):
+    result = app.test_cli_runner().invoke(args=['seed-scale', *option])
+
+    assert result.exit_code == 2
+    assert _db.session.scalar(select(func.count()).select_from(User)) == 0
+
+
+def test_seed_scale_cli(app):
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+    result = app.test_cli_runner().invoke(args=['seed-scale', '--users', '5', '--listings', '20',
+                                                '--loans', '10', '--seed', '1'])
+
+    assert result.exit_code == 0, result.output
+    assert "Added 5 users, 20 listings and 10 loans" in result.output
+    assert _db.session.scalar(select(func.count()).select_from(Listing)) == 20
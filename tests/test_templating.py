@@ -0,0 +1,59 @@
+import os
+from app import create_app
+from app.extensions import db as _db
+from app.templating import configure_templates
+
+
+def test_no_bytecode_cache_by_default(app):
+    assert app.jinja_env.bytecode_cache is None
+
+
+def test_rendered_templates_are_cached_on_disk(tmp_path):
+    app = create_app(testing=True, config={"TEMPLATE_CACHE_DIR": str(tmp_path / "templates")})
+
+    app.test_client().get('/login')
+
+    #login.html and the base template it extends
+    cache = app.jinja_env.bytecode_cache
+    expected = {
+        cache.pattern % cache.get_cache_key(name, app.jinja_env.loader.get_source(app.jinja_env, name)[1])
+        for name in ('login.html', 'base.html')
+    }
+    assert set(os.listdir(tmp_path / "templates")) == expected
+    with app.app_context():
+        _db.session.remove()
+
+
+def test_relative_cache_dir_is_in_instance_folder(app, tmp_path):
+    app.instance_path = str(tmp_path)
+    app.config["TEMPLATE_CACHE_DIR"] = "template_cache"
+    configure_templates(app)
+
+    assert app.config["TEMPLATE_CACHE_DIR"] == os.path.join(app.instance_path, "template_cache")
+    assert app.jinja_env.bytecode_cache.directory == app.config["TEMPLATE_CACHE_DIR"]
+
+
+def test_precompile_at_startup():
+    app = create_app(testing=True, config={"TEMPLATE_PRECOMPILE": True})
+
+    compiled = {name for (_, name) in app.jinja_env.cache.keys()}
+    assert set(app.jinja_env.list_templates(extensions=['html'])) <= compiled
+
+
+def test_precompile_templates_cli(app, tmp_path):
+    app.config["TEMPLATE_CACHE_DIR"] = str(tmp_path)
+    configure_templates(app)
+    templates = app.jinja_env.list_templates(extensions=['html'])
+
+    result = app.test_cli_runner().invoke(args=['precompile-templates'])
+
+    assert result.exit_code == 0, result.output
+    assert f"Compiled {len(templates)} templates" in result.output
+    assert len(os.listdir(tmp_path)) == len(templates)
+
+
+def test_precompile_templates_cli_needs_cache_dir(app):
+    result = app.test_cli_runner().invoke(args=['precompile-templates'])
+
+    assert result.exit_code != 0
+    assert "TEMPLATE_CACHE_DIR" in result.output